@@ -0,0 +1,136 @@
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")
+import argparse
+import itertools
+import json
+import math
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from GPX_TO_STL_TOOL import ElevationProvider, TerrainGenerator, _profile_entry
+class SyntheticElevationProvider(ElevationProvider):
+    """
+    Offline elevation source for benchmarks.
+    Heights come from a fixed sum of sine waves, so every run samples the
+    same terrain without touching the network or the elevation cache.
+    """
+    name = "synthetic"
+    cacheable = False
+    def fetch(self, points):
+        """Return a smooth, hilly elevation in metres for every (lat, lon)."""
+        lat, lon = np.asarray(points, dtype=float).T
+        elevation = (800 + 300 * np.sin(lat * 90) * np.cos(lon * 70)
+                     + 80 * np.sin(lat * 410 + lon * 230) + 25 * np.cos(lon * 1300))
+        return elevation.tolist()
+def write_synthetic_gpx(path, points, seed=0):
+    """
+    Write a GPX file with a random-walk track of `points` points.
+    The walk wanders like a 1 Hz hiking log over a few kilometres and the
+    same seed always produces the same track.
+    """
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.05, points))
+    step = 1.4e-5 * rng.uniform(0.5, 1.5, points)
+    lat = 47.0 + np.cumsum(np.cos(heading) * step)
+    lon = 11.0 + np.cumsum(np.sin(heading) * step) / math.cos(math.radians(47.0))
+    ele = 900 + np.cumsum(rng.normal(0, 0.3, points))
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" creator="GPX_TO_STL_BENCHMARK"><trk><trkseg>\n')
+        for row in zip(lat.tolist(), lon.tolist(), ele.tolist()):
+            f.write('<trkpt lat="%.7f" lon="%.7f"><ele>%.1f</ele></trkpt>\n' % row)
+        f.write('</trkseg></trk></gpx>\n')
+def run_case(gpx_file, output_dir, shape, resolution, grid_size, previews, trace_memory):
+    """Generate one terrain with offline elevation and return its profile entry."""
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        generator = TerrainGenerator(gpx_file, resolution=resolution, shape=shape, output_dir=output_dir,
+                                     verbose=False, elevation_provider=SyntheticElevationProvider(),
+                                     grid_size=grid_size, previews=previews)
+        success = generator.generate_terrain()
+        return _profile_entry(gpx_file, success, time.perf_counter() - start, generator.profile)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+def compare(results, baseline, threshold):
+    """Print cases and stages that got slower than the baseline; return the number of regressions."""
+    previous = {case["case"]: case for case in baseline["cases"]}
+    regressions = 0
+    for case in results["cases"]:
+        before = previous.get(case["case"])
+        if before is None:
+            continue
+        timings = [("total", before["seconds"], case["seconds"])]
+        timings += [(stage, before["stages"][stage]["seconds"], stats["seconds"])
+                    for stage, stats in case["stages"].items() if stage in before["stages"]]
+        for stage, old, new in timings:
+            # Ignore noise on stages that only take a few milliseconds.
+            if new > old * threshold and new - old > 0.05:
+                regressions += 1
+                print(f"REGRESSION {case['case']} {stage}: {old:.3f}s -> {new:.3f}s ({new / old:.2f}x)")
+    print(f"{regressions} regressions against baseline (threshold {threshold:.2f}x)")
+    return regressions
+def main():
+    """Run the benchmark matrix and write the timings as JSON."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the GPX to STL terrain pipeline on synthetic tracks with offline elevation",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 20000],
+                        help="Track point counts of the synthetic GPX files")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[20, 40, 80],
+                        help="Terrain sampling resolutions")
+    parser.add_argument("--shapes", nargs="+", choices=["octagon", "hexagon", "circle", "rectangle"],
+                        default=["octagon", "rectangle"],
+                        help="Model shapes")
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=[150],
+                        help="STL grid sizes")
+    parser.add_argument("--previews", choices=["none", "fast", "full"], default="full",
+                        help="Preview PNGs rendered in every case")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Runs per case; the fastest run is kept")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record peak traced memory per stage (slows every stage down)")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="JSON file the timings are written to")
+    parser.add_argument("--baseline",
+                        help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown factor against the baseline that counts as a regression")
+    args = parser.parse_args()
+    results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+               "numpy": np.__version__, "cases": []}
+    with tempfile.TemporaryDirectory() as work_dir:
+        # One untimed run so lazily imported modules are not charged to the first case.
+        warmup_file = os.path.join(work_dir, "warmup.gpx")
+        write_synthetic_gpx(warmup_file, 200)
+        run_case(warmup_file, os.path.join(work_dir, "warmup"), "octagon", 10, 30, args.previews, False)
+        for points, shape, resolution, grid_size in itertools.product(
+                args.points, args.shapes, args.resolutions, args.grid_sizes):
+            gpx_file = os.path.join(work_dir, f"track_{points}.gpx")
+            if not os.path.exists(gpx_file):
+                write_synthetic_gpx(gpx_file, points)
+            name = f"{shape}-p{points}-r{resolution}-g{grid_size}"
+            runs = [run_case(gpx_file, os.path.join(work_dir, name), shape, resolution, grid_size,
+                             args.previews, args.trace_memory) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["seconds"])
+            best["case"] = name
+            del best["gpx_file"]
+            results["cases"].append(best)
+            slowest = sorted(best["stages"].items(), key=lambda item: -item[1]["seconds"])[:3]
+            stages = ", ".join(f"{stage} {stats['seconds']:.2f}s" for stage, stats in slowest)
+            print(f"{name:<28} {'ok' if best['success'] else 'FAILED':<6} {best['seconds']:7.2f}s  ({stages})")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results saved as {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.threshold) else 0
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
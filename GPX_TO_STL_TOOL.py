@@ -1,675 +1,1907 @@
-import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import cm
-import gpxpy
-import requests
-from shapely.geometry import Point, Polygon
-import math
-import time
-from stl import mesh
-from mpl_toolkits.mplot3d import Axes3D
-import argparse
-import os
-import sys
-class TerrainGenerator:
-    def __init__(self, gpx_file_path, resolution=40, shape="octagon", size=100, 
-                 elevation_multiplier=1.0, track_color="red", track_width=2,
-                 base_thickness=2, output_dir="output", verbose=True,
-                 export_track_stl=False):
-        """
-        Initialize the terrain generator with user settings.
-        Args:
-            gpx_file_path: Path to the GPX file
-            resolution: Number of points along each axis (higher = more detailed but slower)
-            shape: Shape of the terrain ("hexagon", "circle", "rectangle")
-            size: Size of the model in mm
-            elevation_multiplier: Factor to multiply elevation values
-            track_color: Color of the track line
-            track_width: Width of the track line
-            base_thickness: Minimum thickness of the base in mm
-            output_dir: Directory to save output files
-            verbose: Whether to print progress messages
-            export_track_stl: Whether to export the track as a STL file
-        """
-        self.gpx_file_path = gpx_file_path
-        self.resolution = resolution
-        self.shape = shape
-        self.size = size
-        self.elevation_multiplier = elevation_multiplier
-        self.track_color = track_color
-        self.track_width = track_width
-        self.base_thickness = base_thickness
-        self.output_dir = output_dir
-        self.verbose = verbose
-        self.export_track_stl = export_track_stl
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        self.track_points = []
-        self.terrain_points = []
-        self.elevation_data = []
-        self.terrain_mesh = None
-        self.min_lat = float('inf')
-        self.max_lat = float('-inf')
-        self.min_lon = float('inf')
-        self.max_lon = float('-inf')
-        self.min_ele = float('inf')
-        self.max_ele = float('-inf')
-    def log(self, message):
-        """Print message if verbose mode is enabled."""
-        if self.verbose:
-            print(message)
-    def read_gpx(self):
-        """Read and parse the GPX file to extract track points."""
-        self.log(f"Reading GPX file: {self.gpx_file_path}")
-        if not os.path.exists(self.gpx_file_path):
-            raise FileNotFoundError(f"GPX file not found: {self.gpx_file_path}")
-        with open(self.gpx_file_path, 'r') as gpx_file:
-            gpx = gpxpy.parse(gpx_file)
-            for track in gpx.tracks:
-                for segment in track.segments:
-                    for point in segment.points:
-                        lat = point.latitude
-                        lon = point.longitude
-                        ele = point.elevation if point.elevation is not None else 0
-                        self.min_lat = min(self.min_lat, lat)
-                        self.max_lat = max(self.max_lat, lat)
-                        self.min_lon = min(self.min_lon, lon)
-                        self.max_lon = max(self.max_lon, lon)
-                        self.min_ele = min(self.min_ele, ele)
-                        self.max_ele = max(self.max_ele, ele)
-                        self.track_points.append((lat, lon, ele))
-        if not self.track_points:
-            raise ValueError("No track points found in the GPX file")
-        self.log(f"Loaded {len(self.track_points)} track points")
-        self.log(f"Latitude range: {self.min_lat:.6f} to {self.max_lat:.6f}")
-        self.log(f"Longitude range: {self.min_lon:.6f} to {self.max_lon:.6f}")
-        self.log(f"Elevation range: {self.min_ele:.2f}m to {self.max_ele:.2f}m")
-    def generate_boundary_shape(self):
-        """Generate the boundary shape around the track."""
-        self.log(f"Generating {self.shape} boundary with resolution {self.resolution}...")
-        center_lat = (self.min_lat + self.max_lat) / 2
-        center_lon = (self.min_lon + self.max_lon) / 2
-        lat_radius = (self.max_lat - self.min_lat) / 2 * 1.2
-        lon_radius = (self.max_lon - self.min_lon) / 2 * 1.2
-        radius = max(lat_radius, lon_radius)
-        if self.shape == "octagon":
-            vertices = []
-            for i in range(8):
-                angle = 2 * math.pi * i / 8
-                lat = center_lat + radius * math.cos(angle)
-                lon = center_lon + radius * math.sin(angle)
-                vertices.append((lat, lon))
-            self._generate_grid_in_polygon(vertices)
-        elif self.shape == "hexagon":
-            vertices = []
-            for i in range(6):
-                angle = 2 * math.pi * i / 6
-                lat = center_lat + radius * math.cos(angle)
-                lon = center_lon + radius * math.sin(angle)
-                vertices.append((lat, lon))
-            self._generate_grid_in_polygon(vertices)
-        elif self.shape == "circle":
-            self.terrain_points = []
-            step = radius / self.resolution
-            for i in range(-self.resolution, self.resolution + 1):
-                for j in range(-self.resolution, self.resolution + 1):
-                    lat = center_lat + i * step
-                    lon = center_lon + j * step
-                    if ((lat - center_lat) / lat_radius) ** 2 + ((lon - center_lon) / lon_radius) ** 2 <= 1:
-                        self.terrain_points.append((lat, lon))
-        elif self.shape == "rectangle":
-            self.terrain_points = []
-            lat_step = 2 * lat_radius / self.resolution
-            lon_step = 2 * lon_radius / self.resolution
-            for i in range(self.resolution + 1):
-                for j in range(self.resolution + 1):
-                    lat = self.min_lat - lat_radius * 0.2 + i * lat_step
-                    lon = self.min_lon - lon_radius * 0.2 + j * lon_step
-                    self.terrain_points.append((lat, lon))
-        else:
-            raise ValueError(f"Unsupported shape: {self.shape}")
-        self.log(f"Generated {len(self.terrain_points)} terrain points")
-    def _generate_grid_in_polygon(self, vertices):
-        """Generate a grid of points within a polygon defined by vertices."""
-        polygon = Polygon(vertices)
-        min_lat = min(v[0] for v in vertices)
-        max_lat = max(v[0] for v in vertices)
-        min_lon = min(v[1] for v in vertices)
-        max_lon = max(v[1] for v in vertices)
-        step_lat = (max_lat - min_lat) / (self.resolution - 1)
-        step_lon = (max_lon - min_lon) / (self.resolution - 1)
-        for i in range(self.resolution):
-            for j in range(self.resolution):
-                lat = min_lat + step_lat * i
-                lon = min_lon + step_lon * j
-                point = Point(lat, lon)
-                if polygon.contains(point):
-                    self.terrain_points.append((lat, lon))
-    def fetch_elevation_data(self):
-        """Fetch elevation data for all terrain points."""
-        self.log("Fetching elevation data...")
-        batch_size = 100
-        for i in range(0, len(self.terrain_points), batch_size):
-            batch = self.terrain_points[i:i+batch_size]
-            locations = "|".join([f"{lat},{lon}" for lat, lon in batch])
-            url = f"https://api.opentopodata.org/v1/srtm30m?locations={locations}"
-            try:
-                response = requests.get(url)
-                if response.status_code != 200:
-                    self.log(f"API error: {response.status_code} - {response.text}")
-                    for j, (lat, lon) in enumerate(batch):
-                        nearest_point = min(self.track_points, 
-                                           key=lambda p: (p[0]-lat)**2 + (p[1]-lon)**2)
-                        elevation = nearest_point[2]
-                        self.elevation_data.append((lat, lon, elevation))
-                    continue
-                data = response.json()
-                for j, result in enumerate(data['results']):
-                    elevation = result['elevation']
-                    lat, lon = batch[j]
-                    self.elevation_data.append((lat, lon, elevation))
-                    if elevation is not None:
-                        self.min_ele = min(self.min_ele, elevation)
-                        self.max_ele = max(self.max_ele, elevation)
-                self.log(f"Fetched {len(batch)} points ({i+len(batch)}/{len(self.terrain_points)})")
-                time.sleep(1)
-            except Exception as e:
-                self.log(f"Error fetching elevation data: {e}")
-                for j, (lat, lon) in enumerate(batch):
-                    nearest_point = min(self.track_points, 
-                                       key=lambda p: (p[0]-lat)**2 + (p[1]-lon)**2)
-                    elevation = nearest_point[2]
-                    self.elevation_data.append((lat, lon, elevation))
-        self.log(f"Fetched elevation data for {len(self.elevation_data)} points")
-        self.log(f"Elevation range: {self.min_ele:.2f}m to {self.max_ele:.2f}m")
-    def generate_3d_model(self):
-        """Generate a 3D model from the elevation data."""
-        self.log("Generating 3D model...")
-        x_values = [self._lon_to_x(lon) for _, lon, _ in self.elevation_data]
-        y_values = [self._lat_to_y(lat) for lat, _, _ in self.elevation_data]
-        z_values = [ele * self.elevation_multiplier for _, _, ele in self.elevation_data]
-        x_min, x_max = min(x_values), max(x_values)
-        y_min, y_max = min(y_values), max(y_values)
-        z_min, z_max = min(z_values), max(z_values)
-        scale_xy = self.size / max(x_max - x_min, y_max - y_min)
-        x_scaled = [(x - x_min) * scale_xy for x in x_values]
-        y_scaled = [(y - y_min) * scale_xy for y in y_values]
-        scale_z = self.size / 10
-        z_scaled = [self.base_thickness + (z - z_min) * scale_z for z in z_values]
-        fig = plt.figure(figsize=(10, 8))
-        ax = fig.add_subplot(111, projection='3d')
-        scatter = ax.scatter(x_scaled, y_scaled, z_scaled, 
-                       c=z_scaled, cmap='terrain', 
-                       s=20, alpha=0.8)
-        cbar = fig.colorbar(scatter, ax=ax, label='Elevation (mm)')
-        if self.track_points:
-            track_x = [(self._lon_to_x(lon) - x_min) * scale_xy for _, lon, _ in self.track_points]
-            track_y = [(self._lat_to_y(lat) - y_min) * scale_xy for lat, _, _ in self.track_points]
-            track_z = [self.base_thickness + (ele - z_min) * scale_z for _, _, ele in self.track_points]
-            ax.plot(track_x, track_y, track_z, color=self.track_color, 
-                    linewidth=self.track_width, label='Track')
-            ax.legend()
-        ax.set_xlabel('X (mm)')
-        ax.set_ylabel('Y (mm)')
-        ax.set_zlabel('Z (mm)')
-        ax.set_title('3D Terrain Model')
-        base_filename = os.path.splitext(os.path.basename(self.gpx_file_path))[0]
-        output_file = os.path.join(self.output_dir, f"{base_filename}_terrain_preview.png")
-        plt.savefig(output_file, dpi=300)
-        plt.close()
-        self.log(f"3D model preview saved as {output_file}")
-        self._create_2d_heatmap(x_scaled, y_scaled, z_scaled, base_filename)
-        self._create_stl_file(x_scaled, y_scaled, z_scaled, base_filename)
-        if self.export_track_stl and self.track_points:
-            self._create_track_stl_file(x_scaled, y_scaled, z_scaled, 
-                                    track_x, track_y, track_z, base_filename)
-    def _create_2d_heatmap(self, x_scaled, y_scaled, z_scaled, base_filename):
-        """Create a 2D heatmap showing elevation with top-down view."""
-        fig, ax = plt.subplots(figsize=(10, 8))
-        scatter = ax.scatter(x_scaled, y_scaled, c=z_scaled, cmap='terrain', s=20, alpha=0.8)
-        cbar = fig.colorbar(scatter, ax=ax, label='Elevation (mm)')
-        if self.track_points:
-            x_min = min([self._lon_to_x(lon) for _, lon, _ in self.elevation_data])
-            y_min = min([self._lat_to_y(lat) for lat, _, _ in self.elevation_data])
-            scale_xy = self.size / max(
-                max([self._lon_to_x(lon) for _, lon, _ in self.elevation_data]) - x_min,
-                max([self._lat_to_y(lat) for lat, _, _ in self.elevation_data]) - y_min
-            )
-            track_x = [(self._lon_to_x(lon) - x_min) * scale_xy for _, lon, _ in self.track_points]
-            track_y = [(self._lat_to_y(lat) - y_min) * scale_xy for lat, _, _ in self.track_points]
-            ax.plot(track_x, track_y, color=self.track_color, 
-                    linewidth=self.track_width, label='Track')
-            ax.legend()
-        ax.set_xlabel('X (mm)')
-        ax.set_ylabel('Y (mm)')
-        ax.set_title('Terrain Elevation Heatmap')
-        ax.set_aspect('equal')
-        output_file = os.path.join(self.output_dir, f"{base_filename}_terrain_heatmap.png")
-        plt.savefig(output_file, dpi=300)
-        plt.close()
-        self.log(f"2D heatmap saved as {output_file}")
-    def _create_stl_file(self, x_scaled, y_scaled, z_scaled, base_filename):
-        """Create an STL file for 3D printing with proper terrain scaling."""
-        self.log("Generating STL file with realistic terrain heights...")
-        try:
-            grid_size = 150
-            min_x, max_x = min(x_scaled), max(x_scaled)
-            min_y, max_y = min(y_scaled), max(y_scaled)
-            x_grid = np.linspace(min_x, max_x, grid_size)
-            y_grid = np.linspace(min_y, max_y, grid_size)
-            X, Y = np.meshgrid(x_grid, y_grid)
-            center_x = (min_x + max_x) / 2
-            center_y = (min_y + max_y) / 2
-            width = max_x - min_x
-            height = max_y - min_y
-            radius = max(width, height) / 2 * 1.15
-            if self.shape == "octagon":
-                vertices = []
-                for i in range(8):
-                    angle = 2 * math.pi * i / 8
-                    x = center_x + radius * math.cos(angle)
-                    y = center_y + radius * math.sin(angle)
-                    vertices.append((x, y))
-                boundary_polygon = Polygon(vertices)
-            elif self.shape == "hexagon":
-                vertices = []
-                for i in range(6):
-                    angle = 2 * math.pi * i / 6
-                    x = center_x + radius * math.cos(angle)
-                    y = center_y + radius * math.sin(angle)
-                    vertices.append((x, y))
-                boundary_polygon = Polygon(vertices)
-            elif self.shape == "circle":
-                vertices = []
-                for i in range(32):
-                    angle = 2 * math.pi * i / 32
-                    x = center_x + radius * math.cos(angle)
-                    y = center_y + radius * math.sin(angle)
-                    vertices.append((x, y))
-                boundary_polygon = Polygon(vertices)
-            else:
-                margin_x = width * 0.075
-                margin_y = height * 0.075
-                vertices = [
-                    (min_x - margin_x, min_y - margin_y), 
-                    (max_x + margin_x, min_y - margin_y),
-                    (max_x + margin_x, max_y + margin_y), 
-                    (min_x - margin_x, max_y + margin_y)
-                ]
-                boundary_polygon = Polygon(vertices)
-            track_x = [self._lon_to_x(lon) for _, lon, _ in self.track_points]
-            track_y = [self._lat_to_y(lat) for lat, _, _ in self.track_points]
-            track_x_scaled = [(x - self._lon_to_x(self.min_lon)) / 
-                            (self._lon_to_x(self.max_lon) - self._lon_to_x(self.min_lon)) * width + min_x 
-                            for x in track_x]
-            track_y_scaled = [(y - self._lat_to_y(self.min_lat)) / 
-                            (self._lat_to_y(self.max_lat) - self._lat_to_y(self.min_lat)) * height + min_y 
-                            for y in track_y]
-            points_outside = False
-            for tx, ty in zip(track_x_scaled, track_y_scaled):
-                if not boundary_polygon.contains(Point(tx, ty)):
-                    points_outside = True
-                    break
-            if points_outside:
-                self.log("Track extends beyond initial boundary shape. Increasing boundary size.")
-                radius *= 1.25
-                if self.shape == "octagon":
-                    vertices = []
-                    for i in range(8):
-                        angle = 2 * math.pi * i / 8
-                        x = center_x + radius * math.cos(angle)
-                        y = center_y + radius * math.sin(angle)
-                        vertices.append((x, y))
-                    boundary_polygon = Polygon(vertices)
-                elif self.shape == "hexagon":
-                    vertices = []
-                    for i in range(6):
-                        angle = 2 * math.pi * i / 6
-                        x = center_x + radius * math.cos(angle)
-                        y = center_y + radius * math.sin(angle)
-                        vertices.append((x, y))
-                    boundary_polygon = Polygon(vertices)
-                elif self.shape == "circle":
-                    vertices = []
-                    for i in range(32):
-                        angle = 2 * math.pi * i / 32
-                        x = center_x + radius * math.cos(angle)
-                        y = center_y + radius * math.sin(angle)
-                        vertices.append((x, y))
-                    boundary_polygon = Polygon(vertices)
-                else:
-                    margin_x = width * 0.15
-                    margin_y = height * 0.15
-                    vertices = [
-                        (min_x - margin_x, min_y - margin_y), 
-                        (max_x + margin_x, min_y - margin_y),
-                        (max_x + margin_x, max_y + margin_y), 
-                        (min_x - margin_x, max_y + margin_y)
-                    ]
-                    boundary_polygon = Polygon(vertices)
-            inside_mask = np.zeros((grid_size, grid_size), dtype=bool)
-            for i in range(grid_size):
-                for j in range(grid_size):
-                    inside_mask[i, j] = boundary_polygon.contains(Point(X[i, j], Y[i, j]))
-            from scipy.interpolate import griddata
-            points = np.column_stack((x_scaled, y_scaled))
-            min_z = min(z_scaled)
-            max_z = max(z_scaled)
-            z_range = max_z - min_z
-            scaled_z_values = [self.base_thickness + (z - min_z) * (self.size * 0.10 / z_range) for z in z_scaled]
-            Z = griddata(points, scaled_z_values, (X, Y), method='linear')
-            if np.isnan(Z).any():
-                Z_nearest = griddata(points, scaled_z_values, (X, Y), method='nearest')
-                Z[np.isnan(Z)] = Z_nearest[np.isnan(Z)]
-            from scipy.ndimage import gaussian_filter
-            Z = gaussian_filter(Z, sigma=0.5)
-            track_width = width / 40
-            track_height = 0.8
-            if not self.export_track_stl:
-                for i in range(grid_size):
-                    for j in range(grid_size):
-                        if inside_mask[i, j]:
-                            min_dist = float('inf')
-                            for tx, ty in zip(track_x_scaled, track_y_scaled):
-                                dist = np.sqrt((X[i, j] - tx)**2 + (Y[i, j] - ty)**2)
-                                min_dist = min(min_dist, dist)
-                            if min_dist < track_width:
-                                Z[i, j] += track_height * (1 - min_dist / track_width)
-            vertices = []
-            faces = []
-            vertex_indices = np.full((grid_size, grid_size), -1)
-            vertex_count = 0
-            for i in range(grid_size):
-                for j in range(grid_size):
-                    if inside_mask[i, j]:
-                        vertices.append([X[i, j], Y[i, j], Z[i, j]])
-                        vertex_indices[i, j] = vertex_count
-                        vertex_count += 1
-            bottom_offset = vertex_count
-            for i in range(grid_size):
-                for j in range(grid_size):
-                    if inside_mask[i, j]:
-                        vertices.append([X[i, j], Y[i, j], 0])
-                        vertex_count += 1
-            for i in range(grid_size - 1):
-                for j in range(grid_size - 1):
-                    if (inside_mask[i, j] and inside_mask[i+1, j] and 
-                        inside_mask[i, j+1] and inside_mask[i+1, j+1]):
-                        v1 = vertex_indices[i, j]
-                        v2 = vertex_indices[i, j+1]
-                        v3 = vertex_indices[i+1, j]
-                        v4 = vertex_indices[i+1, j+1]
-                        faces.append([v1, v2, v3])
-                        faces.append([v3, v2, v4])
-            for i in range(grid_size - 1):
-                for j in range(grid_size - 1):
-                    if (inside_mask[i, j] and inside_mask[i+1, j] and 
-                        inside_mask[i, j+1] and inside_mask[i+1, j+1]):
-                        v1 = bottom_offset + vertex_indices[i, j]
-                        v2 = bottom_offset + vertex_indices[i, j+1]
-                        v3 = bottom_offset + vertex_indices[i+1, j]
-                        v4 = bottom_offset + vertex_indices[i+1, j+1]
-                        faces.append([v1, v3, v2])
-                        faces.append([v3, v4, v2])
-            edge_points = []
-            for i in range(grid_size):
-                for j in range(grid_size):
-                    if inside_mask[i, j]:
-                        is_edge = False
-                        for ni, nj in [(i+1,j), (i-1,j), (i,j+1), (i,j-1)]:
-                            if (ni < 0 or ni >= grid_size or nj < 0 or nj >= grid_size or 
-                                not inside_mask[ni, nj]):
-                                is_edge = True
-                                break
-                        if is_edge:
-                            edge_points.append((i, j))
-            for i, j in edge_points:
-                top_vertex = vertex_indices[i, j]
-                bottom_vertex = bottom_offset + top_vertex
-                for ni, nj in [(i+1,j), (i,j+1), (i-1,j), (i,j-1)]:
-                    if (0 <= ni < grid_size and 0 <= nj < grid_size and 
-                        inside_mask[ni, nj]):
-                        top_neighbor = vertex_indices[ni, nj]
-                        bottom_neighbor = bottom_offset + top_neighbor
-                        if ni > i or (ni == i and nj > j):
-                            faces.append([top_vertex, top_neighbor, bottom_vertex])
-                            faces.append([bottom_vertex, top_neighbor, bottom_neighbor])
-                        else:
-                            faces.append([top_vertex, bottom_vertex, top_neighbor])
-                            faces.append([bottom_vertex, bottom_neighbor, top_neighbor])
-            vertices = np.array(vertices)
-            faces = np.array(faces)
-            self.log(f"Creating STL mesh with {len(vertices)} vertices and {len(faces)} faces")
-            terrain_mesh = mesh.Mesh(np.zeros(len(faces), dtype=mesh.Mesh.dtype))
-            for i, face in enumerate(faces):
-                for j in range(3):
-                    terrain_mesh.vectors[i][j] = vertices[face[j]]
-            output_file = os.path.join(self.output_dir, f"{base_filename}_terrain_model.stl")
-            terrain_mesh.save(output_file)
-            self.log(f"STL file saved as {output_file}")
-        except Exception as e:
-            self.log(f"Error creating STL file: {e}")
-            import traceback
-            self.log(traceback.format_exc())
-            self.log("Falling back to simplified terrain model...")
-            try:
-                grid_size = 20
-                x_range = max(x_scaled) - min(x_scaled)
-                y_range = max(y_scaled) - min(y_scaled)
-                x_min, y_min = min(x_scaled), min(y_scaled)
-                X = np.array([[x_min + i * x_range / (grid_size-1) for j in range(grid_size)] 
-                            for i in range(grid_size)])
-                Y = np.array([[y_min + j * y_range / (grid_size-1) for j in range(grid_size)] 
-                            for i in range(grid_size)])
-                Z = np.ones((grid_size, grid_size)) * self.base_thickness
-                for i in range(grid_size):
-                    for j in range(grid_size):
-                        dist = ((i - grid_size/2)**2 + (j - grid_size/2)**2) / ((grid_size/2)**2)
-                        if dist < 1:
-                            Z[i, j] += (1 - dist) * self.size / 10
-                vertices = []
-                faces = []
-                for i in range(grid_size):
-                    for j in range(grid_size):
-                        vertices.append([X[i, j], Y[i, j], Z[i, j]])
-                for i in range(grid_size):
-                    for j in range(grid_size):
-                        vertices.append([X[i, j], Y[i, j], 0])
-                for i in range(grid_size - 1):
-                    for j in range(grid_size - 1):
-                        v1 = i * grid_size + j
-                        v2 = i * grid_size + (j + 1)
-                        v3 = (i + 1) * grid_size + j
-                        faces.append([v1, v2, v3])
-                        v1 = (i + 1) * grid_size + j
-                        v2 = i * grid_size + (j + 1)
-                        v3 = (i + 1) * grid_size + (j + 1)
-                        faces.append([v1, v2, v3])
-                offset = grid_size * grid_size
-                for i in range(grid_size - 1):
-                    for j in range(grid_size - 1):
-                        v1 = offset + i * grid_size + j
-                        v2 = offset + (i + 1) * grid_size + j
-                        v3 = offset + i * grid_size + (j + 1)
-                        faces.append([v1, v2, v3])
-                        v1 = offset + i * grid_size + (j + 1)
-                        v2 = offset + (i + 1) * grid_size + j
-                        v3 = offset + (i + 1) * grid_size + (j + 1)
-                        faces.append([v1, v2, v3])
-                for i in range(grid_size - 1):
-                    v1 = (grid_size - 1) * grid_size + i
-                    v2 = (grid_size - 1) * grid_size + (i + 1)
-                    v3 = offset + (grid_size - 1) * grid_size + i
-                    v4 = offset + (grid_size - 1) * grid_size + (i + 1)
-                    faces.append([v1, v2, v3])
-                    faces.append([v2, v4, v3])
-                    v1 = i
-                    v2 = i + 1
-                    v3 = offset + i
-                    v4 = offset + (i + 1)
-                    faces.append([v1, v3, v2])
-                    faces.append([v2, v3, v4])
-                    v1 = i * grid_size + (grid_size - 1)
-                    v2 = (i + 1) * grid_size + (grid_size - 1)
-                    v3 = offset + i * grid_size + (grid_size - 1)
-                    v4 = offset + (i + 1) * grid_size + (grid_size - 1)
-                    faces.append([v1, v3, v2])
-                    faces.append([v2, v3, v4])
-                    v1 = i * grid_size
-                    v2 = (i + 1) * grid_size
-                    v3 = offset + i * grid_size
-                    v4 = offset + (i + 1) * grid_size
-                    faces.append([v1, v2, v3])
-                    faces.append([v2, v4, v3])
-                vertices = np.array(vertices)
-                faces = np.array(faces)
-                terrain_mesh = mesh.Mesh(np.zeros(len(faces), dtype=mesh.Mesh.dtype))
-                for i, face in enumerate(faces):
-                    for j in range(3):
-                        terrain_mesh.vectors[i][j] = vertices[face[j]]
-                output_file = os.path.join(self.output_dir, f"{base_filename}_terrain_model.stl")
-                terrain_mesh.save(output_file)
-                self.log(f"Simplified STL file saved as {output_file}")
-            except Exception as e:
-                self.log(f"Error creating simplified STL file: {e}")
-                import traceback
-                self.log(traceback.format_exc())
-    def _create_track_stl_file(self, x_scaled, y_scaled, z_scaled, track_x, track_y, track_z, base_filename):
-        """Create a separate STL file for just the track."""
-        self.log("Generating track-only STL file...")
-        try:
-            from stl import mesh
-            import numpy as np
-            tube_radius = self.track_width * 0.2
-            tube_segments = 8
-            track_elevation = 0.2
-            min_z = min(z_scaled)
-            max_z = max(z_scaled)
-            z_range = max_z - min_z
-            scaled_track_z = [self.base_thickness + (z - min_z) * (self.size * 0.10 / z_range) + track_elevation 
-                            for z in track_z]
-            vertices = []
-            faces = []
-            vertex_count = 0
-            if len(track_x) < 2:
-                self.log("Not enough track points to create a track STL")
-                return
-            for i in range(len(track_x) - 1):
-                p1 = np.array([track_x[i], track_y[i], scaled_track_z[i]])
-                p2 = np.array([track_x[i+1], track_y[i+1], scaled_track_z[i+1]])
-                if np.linalg.norm(p2 - p1) < 0.01:
-                    continue
-                forward = p2 - p1
-                forward = forward / np.linalg.norm(forward)
-                if abs(forward[0]) < abs(forward[1]):
-                    right = np.cross(forward, [1, 0, 0])
-                else:
-                    right = np.cross(forward, [0, 1, 0])
-                right = right / np.linalg.norm(right)
-                up = np.cross(right, forward)
-                up = up / np.linalg.norm(up)
-                for t, point in [(0, p1), (1, p2)]:
-                    for j in range(tube_segments):
-                        angle = 2 * math.pi * j / tube_segments
-                        circle_point = point + (right * math.cos(angle) + up * math.sin(angle)) * tube_radius
-                        vertices.append(circle_point.tolist())
-                for j in range(tube_segments):
-                    j_next = (j + 1) % tube_segments
-                    v1 = vertex_count + j
-                    v2 = vertex_count + j_next
-                    v3 = vertex_count + tube_segments + j
-                    v4 = vertex_count + tube_segments + j_next
-                    faces.append([v1, v2, v3])
-                    faces.append([v2, v4, v3])
-                vertex_count += tube_segments * 2
-            center_first = np.array([track_x[0], track_y[0], scaled_track_z[0]])
-            vertices.append(center_first.tolist())
-            center_first_idx = len(vertices) - 1
-            for j in range(tube_segments):
-                j_next = (j + 1) % tube_segments
-                faces.append([center_first_idx, j_next, j])
-            center_last = np.array([track_x[-1], track_y[-1], scaled_track_z[-1]])
-            vertices.append(center_last.tolist())
-            center_last_idx = len(vertices) - 1
-            last_circle_start = vertex_count - tube_segments
-            for j in range(tube_segments):
-                j_next = (j + 1) % tube_segments
-                faces.append([center_last_idx, last_circle_start + j, last_circle_start + j_next])
-            vertices = np.array(vertices)
-            faces = np.array(faces)
-            self.log(f"Creating track STL mesh with {len(vertices)} vertices and {len(faces)} faces")
-            track_mesh = mesh.Mesh(np.zeros(len(faces), dtype=mesh.Mesh.dtype))
-            for i, face in enumerate(faces):
-                for j in range(3):
-                    track_mesh.vectors[i][j] = vertices[face[j]]
-            output_file = os.path.join(self.output_dir, f"{base_filename}_track.stl")
-            track_mesh.save(output_file)
-            self.log(f"Track STL file saved as {output_file}")
-        except Exception as e:
-            self.log(f"Error creating track STL file: {e}")
-            import traceback
-            self.log(traceback.format_exc())     
-    def _lat_to_y(self, lat):
-        """Convert latitude to y-coordinate (assuming flat Earth approximation)."""
-        return lat * 111000
-    def _lon_to_x(self, lon):
-        """Convert longitude to x-coordinate (assuming flat Earth approximation)."""
-        avg_lat = (self.min_lat + self.max_lat) / 2
-        return lon * 111000 * math.cos(math.radians(avg_lat))
-    def generate_terrain(self):
-        """Execute the full terrain generation process."""
-        try:
-            self.read_gpx()
-            self.generate_boundary_shape()
-            self.fetch_elevation_data()
-            self.generate_3d_model()
-            self.log("Terrain generation complete!")
-            return True
-        except Exception as e:
-            self.log(f"Error generating terrain: {e}")
-            return False
-def main():
-    """Main function to handle command line arguments and execute the terrain generation."""
-    parser = argparse.ArgumentParser(
-        description="Generate 3D terrain models from GPX files",
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter
-    )
-    parser.add_argument("gpx_file", help="Path to the GPX file")
-    parser.add_argument("--resolution", type=int, default=40,
-                        help="Resolution of the terrain model (higher = more detailed but slower)")
-    parser.add_argument("--shape", choices=["octagon", "hexagon", "circle", "rectangle"], default="octagon",
-                        help="Shape of the terrain model")
-    parser.add_argument("--size", type=float, default=100,
-                        help="Size of the model in mm")
-    parser.add_argument("--elevation-multiplier", type=float, default=1.0,
-                        help="Factor to multiply elevation values")
-    parser.add_argument("--track-color", default="red",
-                        help="Color of the track line")
-    parser.add_argument("--track-width", type=float, default=2,
-                        help="Width of the track line")
-    parser.add_argument("--base-thickness", type=float, default=2,
-                        help="Minimum thickness of the base in mm")
-    parser.add_argument("--output-dir", default="output",
-                        help="Directory to save output files")
-    parser.add_argument("--quiet", action="store_true",
-                        help="Run in quiet mode (no progress messages)")
-    parser.add_argument("--export-track-stl", action="store_true",
-                        help="Export the track as a separate STL file")
-    args = parser.parse_args()
-    generator = TerrainGenerator(
-        gpx_file_path=args.gpx_file,
-        resolution=args.resolution,
-        shape=args.shape,
-        size=args.size,
-        elevation_multiplier=args.elevation_multiplier,
-        track_color=args.track_color,
-        track_width=args.track_width,
-        base_thickness=args.base_thickness,
-        output_dir=args.output_dir,
-        verbose=not args.quiet,
-        export_track_stl=args.export_track_stl
-    )
-    success = generator.generate_terrain()
-    return 0 if success else 1
-if __name__ == "__main__":
+import numpy as np
+import math
+import time
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import tracemalloc
+import zipfile
+from xml.parsers import expat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+def _regular_polygon(center_x, center_y, radius, sides):
+    """Return the vertices of a regular polygon as an (n, 2) array."""
+    angles = 2 * np.pi * np.arange(sides) / sides
+    return np.column_stack((center_x + radius * np.cos(angles),
+                            center_y + radius * np.sin(angles)))
+def _points_in_convex_polygon(x, y, vertices):
+    """
+    Test many points against a convex polygon in one vectorized pass.
+    Points exactly on an edge count as outside, matching shapely's contains().
+    Returns a boolean array with the shape of x.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    vertices = np.asarray(vertices, dtype=float)
+    ax, ay = vertices[:, 0], vertices[:, 1]
+    bx, by = np.roll(ax, -1), np.roll(ay, -1)
+    orientation = np.sign(np.sum(ax * by - bx * ay))
+    inside = np.ones(x.shape, dtype=bool)
+    for x0, y0, x1, y1 in zip(ax, ay, bx, by):
+        inside &= orientation * ((x1 - x0) * (y - y0) - (y1 - y0) * (x - x0)) > 0
+    return inside
+def _segment_distance(px, py, x0, y0, x1, y1):
+    """Exact distance from points to line segments (all arguments broadcast)."""
+    dx = x1 - x0
+    dy = y1 - y0
+    length_sq = dx * dx + dy * dy
+    t = ((px - x0) * dx + (py - y0) * dy) / np.where(length_sq > 0, length_sq, 1)
+    t = np.clip(t, 0, 1)
+    return np.hypot(px - (x0 + t * dx), py - (y0 + t * dy))
+class _PolylineDistance:
+    """
+    Distance from query points to the nearest segment of a polyline.
+    The segments are densified into a KD-tree once, so each call only refines
+    points within reach of the line with the exact segment distance. Points
+    farther than max_distance get inf.
+    """
+    def __init__(self, line_x, line_y, max_distance):
+        from scipy.spatial import cKDTree
+        line_x = np.asarray(line_x, dtype=float)
+        line_y = np.asarray(line_y, dtype=float)
+        self.max_distance = max_distance
+        self.tree = None
+        if len(line_x) == 0:
+            return
+        if len(line_x) == 1:
+            line_x = np.repeat(line_x, 2)
+            line_y = np.repeat(line_y, 2)
+        self.x0, self.y0 = line_x[:-1], line_y[:-1]
+        self.x1, self.y1 = line_x[1:], line_y[1:]
+        self.spacing = max_distance / 8
+        lengths = np.hypot(self.x1 - self.x0, self.y1 - self.y0)
+        counts = np.ceil(lengths / self.spacing).astype(int) + 1
+        self.segment_ids = np.repeat(np.arange(len(lengths)), counts)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        t = (np.arange(len(self.segment_ids)) - starts) / np.maximum(counts - 1, 1)[self.segment_ids]
+        ids = self.segment_ids
+        self.tree = cKDTree(np.column_stack((self.x0[ids] + t * (self.x1 - self.x0)[ids],
+                                             self.y0[ids] + t * (self.y1 - self.y0)[ids])))
+    def __call__(self, px, py):
+        px = np.asarray(px, dtype=float)
+        py = np.asarray(py, dtype=float)
+        distance = np.full(px.shape, np.inf)
+        if self.tree is None or px.size == 0:
+            return distance
+        samples = self.tree.n
+        query = np.column_stack((px.ravel(), py.ravel()))
+        _, nearest = self.tree.query(query, k=4, distance_upper_bound=self.max_distance + self.spacing)
+        found = nearest[:, 0] < samples
+        if not found.any():
+            return distance
+        qx, qy = query[found, 0], query[found, 1]
+        candidates = nearest[found]
+        best = np.full(len(candidates), np.inf)
+        last_segment = len(self.x0) - 1
+        for k in range(candidates.shape[1]):
+            valid = candidates[:, k] < samples
+            segment = self.segment_ids[np.where(valid, candidates[:, k], candidates[:, 0])]
+            for offset in (-1, 0, 1):
+                s = np.clip(segment + offset, 0, last_segment)
+                best = np.minimum(best, _segment_distance(qx, qy, self.x0[s], self.y0[s],
+                                                          self.x1[s], self.y1[s]))
+        distance.ravel()[found] = best
+        return distance
+def _simplify_polyline(x, y, tolerance):
+    """
+    Ramer-Douglas-Peucker simplification of a 2D polyline.
+    Returns a boolean mask of the points to keep; every dropped point lies
+    within `tolerance` of the simplified line. All open spans are split in
+    the same pass, so the work per pass is vectorized over the whole line.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    keep = np.zeros(len(x), dtype=bool)
+    if len(x) < 3 or tolerance <= 0:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+    active = ~keep
+    while active.any():
+        kept = np.flatnonzero(keep)
+        points = np.flatnonzero(active)
+        span = np.searchsorted(kept, points) - 1
+        start, end = kept[span], kept[span + 1]
+        distance = _segment_distance(x[points], y[points], x[start], y[start], x[end], y[end])
+        starts = np.insert(span[1:] != span[:-1], 0, True)
+        group = np.cumsum(starts) - 1
+        farthest = np.maximum.reduceat(distance, np.flatnonzero(starts))
+        split = (farthest > tolerance)[group]
+        active[points[~split]] = False
+        candidates = np.flatnonzero(split & (distance == farthest[group]))
+        _, chosen = np.unique(group[candidates], return_index=True)
+        chosen = points[candidates[chosen]]
+        keep[chosen] = True
+        active[chosen] = False
+    return keep
+def _lattice(points, values):
+    """
+    Put samples that lie on an axis-aligned lattice back into a 2D grid.
+    Returns ((y_axis, x_axis), grid), or None if the points are not a
+    lattice. Lattice nodes without a sample (outside the sampled shape) are
+    filled with the value of the nearest sample in one edge-extension pass.
+    """
+    points = np.asarray(points, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if len(points) < 4:
+        return None
+    axes = []
+    indices = []
+    for column in (1, 0):
+        coordinate = points[:, column]
+        tolerance = 1e-9 * max(float(np.ptp(coordinate)), np.finfo(float).tiny)
+        unique = np.unique(coordinate)
+        axis = unique[np.insert(np.diff(unique) > tolerance, 0, True)]
+        if len(axis) < 2:
+            return None
+        axes.append(axis)
+        indices.append(np.searchsorted(axis, coordinate + tolerance, side='right') - 1)
+    shape = (len(axes[0]), len(axes[1]))
+    if shape[0] * shape[1] > 4 * len(points):
+        return None
+    flat = indices[0] * shape[1] + indices[1]
+    if len(np.unique(flat)) != len(flat):
+        return None
+    grid = np.full(shape, np.nan)
+    grid.ravel()[flat] = values
+    missing = np.isnan(grid)
+    if missing.any():
+        from scipy.ndimage import distance_transform_edt
+        _, (rows, cols) = distance_transform_edt(missing, return_indices=True)
+        grid = grid[rows, cols]
+    return (axes[0], axes[1]), grid
+_STL_RECORD = np.dtype([('normals', '<f4', (3,)), ('vectors', '<f4', (3, 3)), ('attr', '<u2', (1,))])
+def _grid_surface(X, Y, Z, inside_mask):
+    """
+    Build the top surface of a masked grid as an indexed mesh.
+    Every cell whose four corners are inside the mask becomes two triangles.
+    Returns (vertices, faces, vertex_indices).
+    """
+    vertex_indices = np.full(inside_mask.shape, -1, dtype=np.int64)
+    vertex_indices[inside_mask] = np.arange(np.count_nonzero(inside_mask))
+    vertices = np.column_stack((X[inside_mask], Y[inside_mask], Z[inside_mask]))
+    cells = inside_mask[:-1, :-1] & inside_mask[:-1, 1:] & inside_mask[1:, :-1] & inside_mask[1:, 1:]
+    v1 = vertex_indices[:-1, :-1][cells]
+    v2 = vertex_indices[:-1, 1:][cells]
+    v3 = vertex_indices[1:, :-1][cells]
+    v4 = vertex_indices[1:, 1:][cells]
+    faces = np.stack((np.column_stack((v1, v2, v3)), np.column_stack((v3, v2, v4))), axis=1).reshape(-1, 3)
+    return vertices, faces, vertex_indices
+def _leaf_perimeter(size):
+    """Row/column offsets of the 4*size grid vertices on a block perimeter, counter-clockwise from (0, 0)."""
+    k = np.arange(size)
+    return (np.concatenate((np.zeros(size, int), k, np.full(size, size), size - k)),
+            np.concatenate((k, np.full(size, size), size - k, np.zeros(size, int))))
+def _fan_error(padded_z, used, size, r, c):
+    """
+    Largest vertical deviation between the grid samples of each quadtree leaf
+    and its triangulation: a fan from the leaf center through the used
+    vertices on the leaf perimeter (the corners are always used).
+    """
+    half = size // 2
+    a, b = np.meshgrid(np.arange(size + 1), np.arange(size + 1), indexing='ij')
+    a, b = a.ravel(), b.ravel()
+    da, db = a - half, b - half
+    reach = np.maximum(np.abs(da), np.abs(db))
+    scale = half / np.maximum(reach, 1)
+    qa, qb = half + da * scale, half + db * scale
+    position = np.where(np.abs(da) >= np.abs(db),
+                        np.where(da < 0, qb, 3 * size - qb),
+                        np.where(db > 0, size + qa, 4 * size - qa)) % (4 * size)
+    perimeter_r, perimeter_c = _leaf_perimeter(size)
+    ring_r = r[:, None] + np.append(perimeter_r, 0)
+    ring_c = c[:, None] + np.append(perimeter_c, 0)
+    ring_used = used[ring_r, ring_c]
+    ring_z = padded_z[ring_r, ring_c]
+    slots = np.arange(4 * size + 1)
+    previous = np.maximum.accumulate(np.where(ring_used, slots, 0), axis=1)
+    following = np.minimum.accumulate(np.where(ring_used, slots, 4 * size)[:, ::-1], axis=1)[:, ::-1]
+    slot = np.minimum(np.floor(position).astype(int), 4 * size - 1)
+    start = previous[:, slot]
+    stop = following[:, slot + 1]
+    fraction = (position - start) / (stop - start)
+    edge_z = (np.take_along_axis(ring_z, start, axis=1) * (1 - fraction) +
+              np.take_along_axis(ring_z, stop, axis=1) * fraction)
+    center_z = padded_z[r + half, c + half][:, None]
+    surface = center_z + (edge_z - center_z) * (reach / half)
+    return np.abs(padded_z[r[:, None] + a, c[:, None] + b] - surface).max(axis=1)
+def _adaptive_grid_surface(X, Y, Z, inside_mask, tolerance, pinned=None):
+    """
+    Build the top surface of a masked grid with as few triangles as possible
+    while every grid sample stays within `tolerance` of the surface.
+    Quadtree blocks are merged level by level (coarse to fine); an accepted
+    block is triangulated as a fan from its center through every vertex that
+    neighbouring leaves use on its perimeter, so the mesh has no cracks.
+    Leaves whose fan exceeds the tolerance once their neighbours are known
+    are split and the tree is rebuilt until none do. Vertices in the optional
+    `pinned` mask are always kept (used to make neighbouring tiles conform).
+    Returns (vertices, faces, vertex_indices) like _grid_surface.
+    """
+    cells = inside_mask[:-1, :-1] & inside_mask[:-1, 1:] & inside_mask[1:, :-1] & inside_mask[1:, 1:]
+    rows, cols = cells.shape
+    side = 1 << int(math.ceil(math.log2(max(rows, cols, 1))))
+    padded_cells = np.zeros((side, side), dtype=bool)
+    padded_cells[:rows, :cols] = cells
+    padded_z = np.zeros((side + 1, side + 1))
+    padded_z[:rows + 1, :cols + 1] = Z
+    rejected = {}
+    while True:
+        covered = np.zeros((1, 1), dtype=bool)
+        leaves = []
+        size = side
+        while size >= 2:
+            count = side // size
+            candidates = padded_cells.reshape(count, size, count, size).all(axis=(1, 3)) & ~covered
+            if size in rejected:
+                candidates &= ~rejected[size]
+            r, c = np.nonzero(candidates)
+            if len(r):
+                corners = np.zeros((side + 1, side + 1), dtype=bool)
+                corners[::size, ::size] = True
+                keep = _fan_error(padded_z, corners, size, r * size, c * size) <= tolerance
+                candidates[r[~keep], c[~keep]] = False
+                r, c = r[keep], c[keep]
+            leaves.append((size, r * size, c * size))
+            covered = (covered | candidates).repeat(2, axis=0).repeat(2, axis=1)
+            size //= 2
+        single_r, single_c = np.nonzero(padded_cells & ~covered)
+        used = np.zeros((side + 1, side + 1), dtype=bool)
+        for dr, dc in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            used[single_r + dr, single_c + dc] = True
+        for size, r, c in leaves:
+            for dr, dc in ((0, 0), (0, size), (size, 0), (size, size), (size // 2, size // 2)):
+                used[r + dr, c + dc] = True
+        if pinned is not None:
+            used[:rows + 1, :cols + 1] |= pinned
+        split = False
+        for size, r, c in leaves:
+            if not len(r):
+                continue
+            too_far = _fan_error(padded_z, used, size, r, c) > tolerance
+            if too_far.any():
+                rejected.setdefault(size, np.zeros((side // size, side // size), dtype=bool))
+                rejected[size][r[too_far] // size, c[too_far] // size] = True
+                split = True
+        if not split:
+            break
+    used = used[:rows + 1, :cols + 1]
+    vertex_indices = np.full(used.shape, -1, dtype=np.int64)
+    vertex_indices[used] = np.arange(np.count_nonzero(used))
+    vertices = np.column_stack((X[used], Y[used], Z[used]))
+    v1 = vertex_indices[single_r, single_c]
+    v2 = vertex_indices[single_r, single_c + 1]
+    v3 = vertex_indices[single_r + 1, single_c]
+    v4 = vertex_indices[single_r + 1, single_c + 1]
+    faces = [np.stack((np.column_stack((v1, v2, v3)), np.column_stack((v3, v2, v4))), axis=1).reshape(-1, 3)]
+    for size, r, c in leaves:
+        if not len(r):
+            continue
+        perimeter_r, perimeter_c = _leaf_perimeter(size)
+        ring_r = r[:, None] + perimeter_r
+        ring_c = c[:, None] + perimeter_c
+        leaf, position = np.nonzero(used[ring_r, ring_c])
+        ring = vertex_indices[ring_r[leaf, position], ring_c[leaf, position]]
+        following = np.arange(1, len(ring) + 1)
+        last = np.append(leaf[1:] != leaf[:-1], True)
+        following[last] = np.flatnonzero(np.insert(leaf[1:] != leaf[:-1], 0, True))
+        center = vertex_indices[r + size // 2, c + size // 2][leaf]
+        faces.append(np.column_stack((center, ring, ring[following])))
+    return vertices, np.vstack(faces), vertex_indices
+def _tube_mesh(points, radius, segments, min_step=0.01):
+    """
+    Build a closed tube of the given radius around a 3D polyline.
+    Consecutive points closer than min_step are merged. Every remaining point
+    gets one ring of vertices oriented along the bisector of its neighbouring
+    segments, with frames parallel-transported along the line so the tube
+    does not twist. Both ends are closed with a fan around the end point.
+    Returns (vertices, faces), or None if the line is too short.
+    """
+    points = np.asarray(points, dtype=float)
+    steps = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    points = points[np.insert(steps >= min_step, 0, True)]
+    if len(points) < 2:
+        return None
+    directions = np.diff(points, axis=0)
+    directions /= np.maximum(np.linalg.norm(directions, axis=1, keepdims=True), 1e-12)
+    tangents = np.vstack((directions[:1], directions[:-1] + directions[1:], directions[-1:]))
+    lengths = np.linalg.norm(tangents, axis=1, keepdims=True)
+    tangents = np.where(lengths > 1e-9, tangents / np.maximum(lengths, 1e-12),
+                        np.vstack((directions, directions[-1:])))
+    # Reference frames are cheap to build per point but twist arbitrarily;
+    # the twist between neighbours is measured against a parallel transport
+    # step and removed with a cumulative rotation.
+    axis = np.where((np.abs(tangents[:, 0]) < np.abs(tangents[:, 1]))[:, None], [1.0, 0, 0], [0, 1.0, 0])
+    normal = np.cross(tangents, axis)
+    normal /= np.linalg.norm(normal, axis=1, keepdims=True)
+    binormal = np.cross(tangents, normal)
+    t0, t1, n0 = tangents[:-1], tangents[1:], normal[:-1]
+    k = np.cross(t0, t1)
+    c = np.einsum('ij,ij->i', t0, t1)[:, None]
+    turn = 1 + c
+    transported = np.where(turn > 1e-9, n0 * c + np.cross(k, n0) +
+                           k * np.einsum('ij,ij->i', k, n0)[:, None] / np.maximum(turn, 1e-9), n0)
+    twist = np.arctan2(np.einsum('ij,ij->i', transported, binormal[1:]),
+                       np.einsum('ij,ij->i', transported, normal[1:]))
+    twist = np.insert(np.cumsum(twist), 0, 0.0)[:, None]
+    normal, binormal = (normal * np.cos(twist) + binormal * np.sin(twist),
+                        binormal * np.cos(twist) - normal * np.sin(twist))
+    angles = 2 * np.pi * np.arange(segments) / segments
+    rings = (points[:, None, :] + radius * (normal[:, None, :] * np.cos(angles)[None, :, None] +
+                                            binormal[:, None, :] * np.sin(angles)[None, :, None]))
+    count = len(points)
+    vertices = np.vstack((rings.reshape(-1, 3), points[0], points[-1]))
+    j = np.arange(segments)
+    j_next = (j + 1) % segments
+    v1 = (np.arange(count - 1)[:, None] * segments + j).ravel()
+    v2 = (np.arange(count - 1)[:, None] * segments + j_next).ravel()
+    v3, v4 = v1 + segments, v2 + segments
+    first, last = count * segments, count * segments + 1
+    last_ring = (count - 1) * segments
+    faces = np.vstack((np.stack((np.column_stack((v1, v2, v3)),
+                                 np.column_stack((v2, v4, v3))), axis=1).reshape(-1, 3),
+                       np.column_stack((np.full(segments, first), j_next, j)),
+                       np.column_stack((np.full(segments, last), last_ring + j, last_ring + j_next))))
+    return vertices, faces
+def _format_size(num_bytes):
+    """Format a byte count for log messages."""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+def _boundary_edges(faces, owned=None):
+    """
+    Indices into faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2) of the directed
+    edges used by exactly one face. Faces after the first `owned` ones only
+    provide context: they cancel shared edges but are never reported.
+    """
+    edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    low = np.minimum(edges[:, 0], edges[:, 1])
+    high = np.maximum(edges[:, 0], edges[:, 1])
+    _, inverse, uses = np.unique(low * (int(high.max(initial=0)) + 1) + high,
+                                 return_inverse=True, return_counts=True)
+    boundary = uses[inverse.ravel()] == 1
+    if owned is not None:
+        boundary[3 * owned:] = False
+    return np.flatnonzero(boundary)
+def _solidify(vertices, faces, floor=0.0, boundary=None):
+    """
+    Close a top surface into a watertight solid.
+    Adds a flat bottom at z=floor and a vertical skirt along every boundary
+    edge, i.e. every edge used by exactly one top face, unless the directed
+    boundary edges are passed in explicitly.
+    """
+    count = len(vertices)
+    bottom = vertices.copy()
+    bottom[:, 2] = floor
+    if boundary is None:
+        boundary = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)[_boundary_edges(faces)]
+    a, b = boundary[:, 0], boundary[:, 1]
+    skirt = np.stack((np.column_stack((b, a, a + count)),
+                      np.column_stack((b, a + count, b + count))), axis=1).reshape(-1, 3)
+    return (np.vstack((vertices, bottom)),
+            np.vstack((faces, faces[:, ::-1] + count, skirt)))
+class _StlWriter:
+    """
+    Incremental binary STL writer for a path or a seekable binary file object.
+    Indexed meshes are appended chunk by chunk and the triangle count in the
+    header is filled in when the writer is closed.
+    """
+    def __init__(self, output_file, chunk_size=65536):
+        self.owns_file = isinstance(output_file, (str, os.PathLike))
+        self.file = open(output_file, 'wb') if self.owns_file else output_file
+        self.start = self.file.tell()
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.file.write(b'Binary STL generated by GPX_TO_STL_TOOL'.ljust(80, b' '))
+        self.file.write(np.uint32(0).tobytes())
+    def write(self, vertices, faces):
+        """Append the triangles of an indexed mesh."""
+        for start in range(0, len(faces), self.chunk_size):
+            triangles = vertices[faces[start:start + self.chunk_size]]
+            normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+            lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+            record = np.zeros(len(triangles), dtype=_STL_RECORD)
+            record['normals'] = normals / np.where(lengths > 0, lengths, 1)
+            record['vectors'] = triangles
+            self.file.write(record.tobytes())
+        self.count += len(faces)
+    def close(self):
+        end = self.file.tell()
+        self.file.seek(self.start + 80)
+        self.file.write(np.uint32(self.count).tobytes())
+        self.file.seek(end)
+        if self.owns_file:
+            self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+def _write_binary_stl(output_file, vertices, faces, chunk_size=65536):
+    """Stream an indexed mesh to a binary STL file without materializing every triangle."""
+    with _StlWriter(output_file, chunk_size) as writer:
+        writer.write(vertices, faces)
+MESH_FORMATS = ("stl", "3mf", "ply", "obj")
+_3MF_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+    '</Types>\n')
+_3MF_RELATIONSHIPS = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+    'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+    '</Relationships>\n')
+def _format_rows(row_format, rows):
+    """Format every row of a 2D array with one %-operation instead of a Python loop per row."""
+    return ((row_format * len(rows)) % tuple(rows.ravel().tolist())).encode()
+class _IndexedMeshWriter:
+    """
+    Incremental writer for formats that keep the shared-vertex index:
+    binary PLY, OBJ and 3MF (zip-compressed XML), to a path or binary file object.
+    Vertices and faces are appended chunk by chunk to two temporary files,
+    which are joined behind a header with the final counts when the writer
+    is closed. Vertices passed with ids are written only once, so meshes
+    written in pieces (e.g. tiles sharing their borders) stay welded; only
+    the ids a retain filter says may still recur are remembered.
+    """
+    def __init__(self, output_file, mesh_format, chunk_size=65536):
+        self.output_file = output_file
+        self.mesh_format = mesh_format
+        self.chunk_size = chunk_size
+        self.vertex_count = 0
+        self.face_count = 0
+        self.known_ids = np.zeros(0, dtype=np.int64)
+        self.known_index = np.zeros(0, dtype=np.int64)
+        directory = None
+        if isinstance(output_file, (str, os.PathLike)):
+            directory = os.path.dirname(os.path.abspath(output_file))
+        self.vertex_file = tempfile.TemporaryFile(dir=directory)
+        self.face_file = tempfile.TemporaryFile(dir=directory)
+    def _encode_vertices(self, vertices):
+        if self.mesh_format == "ply":
+            return vertices.astype('<f4').tobytes()
+        if self.mesh_format == "obj":
+            return _format_rows("v %.5f %.5f %.5f\n", vertices)
+        return _format_rows('<vertex x="%.5f" y="%.5f" z="%.5f"/>\n', vertices)
+    def _encode_faces(self, faces):
+        if self.mesh_format == "ply":
+            record = np.empty(len(faces), dtype=[('count', 'u1'), ('indices', '<i4', (3,))])
+            record['count'] = 3
+            record['indices'] = faces
+            return record.tobytes()
+        if self.mesh_format == "obj":
+            return _format_rows("f %d %d %d\n", faces + 1)
+        return _format_rows('<triangle v1="%d" v2="%d" v3="%d"/>\n', faces)
+    def write(self, vertices, faces, ids=None, retain=None):
+        """
+        Append an indexed mesh; vertices whose id was written before are reused.
+        retain(ids) returns which known ids later writes may still use; the
+        others are forgotten, so the id map stays as small as the seams.
+        """
+        if ids is None:
+            new = np.ones(len(vertices), dtype=bool)
+            local = np.arange(self.vertex_count, self.vertex_count + len(vertices))
+        else:
+            position = np.minimum(np.searchsorted(self.known_ids, ids), max(len(self.known_ids) - 1, 0))
+            new = np.ones(len(ids), dtype=bool)
+            if len(self.known_ids):
+                new = self.known_ids[position] != ids
+            local = np.empty(len(ids), dtype=np.int64)
+            local[~new] = self.known_index[position[~new]]
+            local[new] = np.arange(self.vertex_count, self.vertex_count + new.sum())
+            known_ids = np.concatenate((self.known_ids, ids[new]))
+            known_index = np.concatenate((self.known_index, local[new]))
+            if retain is not None:
+                keep = retain(known_ids)
+                known_ids, known_index = known_ids[keep], known_index[keep]
+            order = np.argsort(known_ids, kind='stable')
+            self.known_ids, self.known_index = known_ids[order], known_index[order]
+        fresh = vertices[new]
+        for start in range(0, len(fresh), self.chunk_size):
+            self.vertex_file.write(self._encode_vertices(fresh[start:start + self.chunk_size]))
+        for start in range(0, len(faces), self.chunk_size):
+            self.face_file.write(self._encode_faces(local[faces[start:start + self.chunk_size]]))
+        self.vertex_count += len(fresh)
+        self.face_count += len(faces)
+    def _assemble(self, out, header, middle, footer):
+        out.write(header)
+        self.vertex_file.seek(0)
+        shutil.copyfileobj(self.vertex_file, out)
+        out.write(middle)
+        self.face_file.seek(0)
+        shutil.copyfileobj(self.face_file, out)
+        out.write(footer)
+    def _open_output(self):
+        if isinstance(self.output_file, (str, os.PathLike)):
+            return open(self.output_file, 'wb')
+        return contextlib.nullcontext(self.output_file)
+    def close(self):
+        try:
+            if self.mesh_format == "ply":
+                header = ("ply\nformat binary_little_endian 1.0\ncomment generated by GPX_TO_STL_TOOL\n"
+                          f"element vertex {self.vertex_count}\n"
+                          "property float x\nproperty float y\nproperty float z\n"
+                          f"element face {self.face_count}\n"
+                          "property list uchar int vertex_indices\nend_header\n")
+                with self._open_output() as out:
+                    self._assemble(out, header.encode(), b'', b'')
+            elif self.mesh_format == "obj":
+                header = (f"# generated by GPX_TO_STL_TOOL\n"
+                          f"# {self.vertex_count} vertices, {self.face_count} faces\n")
+                with self._open_output() as out:
+                    self._assemble(out, header.encode(), b'', b'')
+            else:
+                header = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                          '<model unit="millimeter" xml:lang="en-US" '
+                          'xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+                          '<resources><object id="1" type="model"><mesh><vertices>\n')
+                with zipfile.ZipFile(self.output_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+                    archive.writestr("[Content_Types].xml", _3MF_CONTENT_TYPES)
+                    archive.writestr("_rels/.rels", _3MF_RELATIONSHIPS)
+                    with archive.open("3D/3dmodel.model", 'w', force_zip64=True) as out:
+                        self._assemble(out, header.encode(), b'</vertices><triangles>\n',
+                                       b'</triangles></mesh></object></resources>'
+                                       b'<build><item objectid="1"/></build></model>\n')
+        finally:
+            self.vertex_file.close()
+            self.face_file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+def _grid_tiles(rows, cols, tile_size):
+    """
+    Split a grid of rows x cols vertices into tiles of at most tile_size cells.
+    Yields inclusive vertex ranges (r0, r1, c0, c1); neighbouring tiles share
+    their border row or column.
+    """
+    for r0 in range(0, max(rows - 1, 1), tile_size):
+        for c0 in range(0, max(cols - 1, 1), tile_size):
+            yield r0, min(r0 + tile_size, rows - 1), c0, min(c0 + tile_size, cols - 1)
+def _tile_seams(rows, cols, r0, r1, c1):
+    """
+    Return a filter for the vertex ids of a rows x cols grid (repeated every
+    rows * cols for further layers) that tiles after (r0, r1, c0, c1) in
+    _grid_tiles order can still share: the bottom row of the current tile
+    row and the right column of the current tile.
+    """
+    def retain(ids):
+        row, col = np.divmod(ids % (rows * cols), cols)
+        return (row >= r1) | ((row >= r0) & (col >= c1))
+    return retain
+def _file_digest(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+TRACK_DTYPE = np.dtype([('lat', 'f8'), ('lon', 'f8'), ('ele', 'f8')])
+def read_track_points(path, chunk_size=65536):
+    """
+    Stream the track points of a GPX file into a TRACK_DTYPE array.
+    Uses an expat SAX parser, so no element tree is built; points are
+    buffered in chunks of chunk_size and packed into NumPy arrays, keeping
+    memory bounded by the output rather than the XML document.
+    Missing elevations are read as 0.
+    """
+    chunks = []
+    buffer = []
+    state = {'point': None, 'ele': [], 'in_ele': False}
+    def local(name):
+        return name.rsplit(':', 1)[-1]
+    def start(name, attrs):
+        name = local(name)
+        if name == 'trkpt':
+            state['point'] = (float(attrs['lat']), float(attrs['lon']))
+            state['ele'] = []
+        elif name == 'ele' and state['point'] is not None:
+            state['in_ele'] = True
+    def end(name):
+        name = local(name)
+        if name == 'ele':
+            state['in_ele'] = False
+        elif name == 'trkpt' and state['point'] is not None:
+            text = ''.join(state['ele']).strip()
+            buffer.append((*state['point'], float(text) if text else 0.0))
+            state['point'] = None
+            if len(buffer) >= chunk_size:
+                chunks.append(np.array(buffer, dtype=TRACK_DTYPE))
+                buffer.clear()
+    def characters(data):
+        if state['in_ele']:
+            state['ele'].append(data)
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = characters
+    with open(path, 'rb') as gpx_file:
+        parser.ParseFile(gpx_file)
+    chunks.append(np.array(buffer, dtype=TRACK_DTYPE))
+    return np.concatenate(chunks)
+class ElevationCache:
+    """
+    Persistent SQLite store of elevation samples.
+    Samples are keyed by dataset and by latitude/longitude quantized to
+    `precision` decimal places. Once more than `max_entries` samples are
+    stored, the least recently used ones are evicted.
+    """
+    def __init__(self, path, dataset="srtm30m", precision=5, max_entries=2000000):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.dataset = dataset
+        self.scale = 10 ** precision
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS elevations ("
+            "dataset TEXT NOT NULL, lat_key INTEGER NOT NULL, lon_key INTEGER NOT NULL, "
+            "elevation REAL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (dataset, lat_key, lon_key))")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS elevations_last_used ON elevations (last_used)")
+        self.connection.execute(
+            "CREATE TEMP TABLE lookup (idx INTEGER PRIMARY KEY, lat_key INTEGER, lon_key INTEGER)")
+        self.connection.commit()
+    def _key(self, lat, lon):
+        return int(round(lat * self.scale)), int(round(lon * self.scale))
+    def get_many(self, points):
+        """Return {index: elevation} for every (lat, lon) in points that is already cached."""
+        with self.connection:
+            self.connection.execute("DELETE FROM lookup")
+            self.connection.executemany(
+                "INSERT INTO lookup VALUES (?, ?, ?)",
+                ((i, *self._key(lat, lon)) for i, (lat, lon) in enumerate(points)))
+            rows = self.connection.execute(
+                "SELECT lookup.idx, elevations.elevation FROM lookup JOIN elevations "
+                "ON elevations.dataset = ? AND elevations.lat_key = lookup.lat_key "
+                "AND elevations.lon_key = lookup.lon_key", (self.dataset,)).fetchall()
+            self.connection.execute(
+                "UPDATE elevations SET last_used = ? WHERE dataset = ? AND "
+                "(lat_key, lon_key) IN (SELECT lat_key, lon_key FROM lookup)",
+                (time.time(), self.dataset))
+        found = dict(rows)
+        self.hits += len(found)
+        self.misses += len(points) - len(found)
+        return found
+    def put_many(self, points, elevations):
+        """Store elevations for (lat, lon) points and evict the oldest entries if over capacity."""
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO elevations VALUES (?, ?, ?, ?, ?)",
+                ((self.dataset, *self._key(lat, lon), elevation, now)
+                 for (lat, lon), elevation in zip(points, elevations)))
+            count = self.connection.execute("SELECT COUNT(*) FROM elevations").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM elevations WHERE rowid IN "
+                    "(SELECT rowid FROM elevations ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,))
+    def close(self):
+        """Close the underlying database connection."""
+        self.connection.close()
+class ElevationProvider:
+    """
+    Base class for elevation sources used by TerrainGenerator.
+    Subclasses set `name` (used as the cache dataset key) and `batch_size`
+    (None means all points are sampled in one call) and implement fetch().
+    """
+    name = None
+    batch_size = None
+    cacheable = True
+    def fetch(self, points):
+        """Return the elevation for every (lat, lon) in points; raise if the batch failed."""
+        raise NotImplementedError
+    def fetch_batches(self, batches):
+        """Yield (batch number, elevations, error) for every batch; error is None on success."""
+        for number, batch in enumerate(batches):
+            try:
+                yield number, self.fetch(batch), None
+            except Exception as e:
+                yield number, None, e
+class _RateLimiter:
+    """
+    Thread-safe request pacing shared by all fetch workers.
+    The rate halves on every throttled or failed request and recovers
+    additively on success, never exceeding the configured budget.
+    With shared=True the state lives in shared memory, so one limiter
+    handed to a process pool paces the requests of every worker process.
+    """
+    def __init__(self, requests_per_second, shared=False):
+        self.max_rate = requests_per_second or 0
+        if shared:
+            self.state = multiprocessing.Array('d', [self.max_rate, 0.0])
+            self.lock = self.state.get_lock()
+        else:
+            self.state = [self.max_rate, 0.0]
+            self.lock = threading.Lock()
+    def wait(self):
+        """Block until the caller may send its next request."""
+        with self.lock:
+            rate, next_slot = self.state[0], self.state[1]
+            now = time.monotonic()
+            slot = max(now, next_slot)
+            if rate:
+                self.state[1] = slot + 1 / rate
+        if slot > now:
+            time.sleep(slot - now)
+    def penalize(self, delay=0):
+        """Slow down after a throttled request and hold all workers for at least `delay` seconds."""
+        with self.lock:
+            if self.max_rate:
+                self.state[0] = max(self.max_rate / 16, self.state[0] / 2)
+            self.state[1] = max(self.state[1], time.monotonic() + delay)
+    def reward(self):
+        """Recover speed after a successful request."""
+        with self.lock:
+            if self.max_rate:
+                self.state[0] = min(self.max_rate, self.state[0] + self.max_rate / 10)
+class OpenTopoDataProvider(ElevationProvider):
+    """
+    Elevation from the OpenTopoData HTTP API.
+    Batches are sent from a pool of `concurrency` threads over one pooled
+    session, paced to `requests_per_second` (None for no limit). Throttled
+    (429) and server-error responses are retried up to `retries` times with
+    exponential backoff, honouring Retry-After when the server sends it.
+    Pass a shared `limiter` to pace several providers with one budget.
+    """
+    def __init__(self, dataset="srtm30m", base_url="https://api.opentopodata.org/v1",
+                 batch_size=100, concurrency=4, requests_per_second=1.0, retries=3,
+                 backoff=1.0, timeout=30, limiter=None):
+        self.name = dataset
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = limiter or _RateLimiter(requests_per_second)
+        import requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+    def fetch(self, points):
+        import requests
+        locations = "|".join([f"{lat},{lon}" for lat, lon in points])
+        url = f"{self.base_url}/{self.name}?locations={locations}"
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if response.status_code == 200:
+                    self.limiter.reward()
+                    return [result['elevation'] for result in response.json()['results']]
+                error = RuntimeError(f"API error: {response.status_code} - {response.text}")
+                if response.status_code != 429 and response.status_code < 500:
+                    raise error
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.strip().isdigit():
+                    delay = float(retry_after)
+            self.limiter.penalize(delay if attempt < self.retries else 0)
+        raise error
+    def fetch_batches(self, batches):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self.fetch, batch): number
+                       for number, batch in enumerate(batches)}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+class HGTProvider(ElevationProvider):
+    """
+    Offline elevation from SRTM .hgt tiles in a local directory.
+    Tiles are memory-mapped, so only the pages around sampled points are read,
+    and all points of a tile are bilinearly interpolated in one vectorized pass.
+    """
+    name = "srtm-hgt"
+    cacheable = False
+    VOID = -32768
+    def __init__(self, directory):
+        self.directory = directory
+        self.tiles = {}
+    @staticmethod
+    def tile_name(lat, lon):
+        """Return the SRTM file name of the 1x1 degree tile whose south-west corner is (lat, lon)."""
+        return (f"{'N' if lat >= 0 else 'S'}{abs(lat):02d}"
+                f"{'E' if lon >= 0 else 'W'}{abs(lon):03d}.hgt")
+    def _tile(self, lat, lon):
+        key = (lat, lon)
+        if key not in self.tiles:
+            path = os.path.join(self.directory, self.tile_name(lat, lon))
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"SRTM tile not found: {path}")
+            samples = int(round(math.sqrt(os.path.getsize(path) / 2)))
+            self.tiles[key] = np.memmap(path, dtype='>i2', mode='r', shape=(samples, samples))
+        return self.tiles[key]
+    def fetch(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        lat, lon = points[:, 0], points[:, 1]
+        elevations = np.full(len(points), np.nan)
+        tile_lat = np.floor(lat).astype(int)
+        tile_lon = np.floor(lon).astype(int)
+        for south, west in set(zip(tile_lat.tolist(), tile_lon.tolist())):
+            selected = (tile_lat == south) & (tile_lon == west)
+            tile = self._tile(south, west)
+            last = tile.shape[0] - 1
+            row = (south + 1 - lat[selected]) * last
+            col = (lon[selected] - west) * last
+            r0 = np.clip(np.floor(row).astype(int), 0, last - 1)
+            c0 = np.clip(np.floor(col).astype(int), 0, last - 1)
+            fr = row - r0
+            fc = col - c0
+            corners = np.stack((tile[r0, c0], tile[r0, c0 + 1],
+                                tile[r0 + 1, c0], tile[r0 + 1, c0 + 1])).astype(float)
+            weights = np.stack(((1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc))
+            weights[corners == self.VOID] = 0
+            total = weights.sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                elevations[selected] = (weights * corners).sum(axis=0) / total
+        return [None if np.isnan(elevation) else float(elevation) for elevation in elevations]
+PROJECTIONS = ("equirectangular", "enu")
+class Projection:
+    """
+    Map latitude/longitude arrays to local x/y coordinates in metres.
+    "equirectangular" scales longitude by the cosine of the mid latitude,
+    which is fast and keeps the elevation lattice axis-aligned. "enu"
+    projects onto the WGS84 tangent plane at the centre of the bounds,
+    which stays accurate for tracks spanning hundreds of kilometres; the
+    lattice is then slightly rotated, so interpolation falls back to
+    triangulating the samples.
+    """
+    def __init__(self, min_lat, max_lat, min_lon, max_lon, method="equirectangular"):
+        if method not in PROJECTIONS:
+            raise ValueError(f"Unknown projection: {method}")
+        self.method = method
+        self.lat0 = math.radians((min_lat + max_lat) / 2)
+        self.lon0 = math.radians((min_lon + max_lon) / 2)
+        self.lon_scale = 111000 * math.cos(self.lat0)
+        self.origin = self._ecef(self.lat0, self.lon0)
+    @staticmethod
+    def _ecef(lat, lon):
+        """Earth-centred coordinates of points on the WGS84 ellipsoid (radians in, metres out)."""
+        a = 6378137.0
+        e2 = 6.69437999014e-3
+        sin_lat = np.sin(lat)
+        n = a / np.sqrt(1 - e2 * sin_lat ** 2)
+        return (n * np.cos(lat) * np.cos(lon), n * np.cos(lat) * np.sin(lon), n * (1 - e2) * sin_lat)
+    def __call__(self, lat, lon):
+        """Return (x, y) arrays in metres for arrays of latitudes and longitudes in degrees."""
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        if self.method == "equirectangular":
+            return lon * self.lon_scale, lat * 111000
+        dx, dy, dz = (c - c0 for c, c0 in zip(self._ecef(np.radians(lat), np.radians(lon)), self.origin))
+        sin_lat, cos_lat = math.sin(self.lat0), math.cos(self.lat0)
+        sin_lon, cos_lon = math.sin(self.lon0), math.cos(self.lon0)
+        east = -sin_lon * dx + cos_lon * dy
+        north = -sin_lat * cos_lon * dx - sin_lat * sin_lon * dy + cos_lat * dz
+        return east, north
+class TerrainModel:
+    """
+    In-memory result of TerrainGenerator.build_model().
+    Attributes:
+        x, y: Model coordinates in mm of the heightmap columns and rows
+        heightmap: Top surface height in mm of every grid sample (NaN outside the boundary)
+        mask: Boolean grid of the samples inside the boundary
+        vertices, faces: Watertight indexed terrain mesh
+        track: Indexed track tube as (vertices, faces), or None
+    """
+    def __init__(self, x, y, heightmap, mask, vertices, faces, track=None):
+        self.x = x
+        self.y = y
+        self.heightmap = heightmap
+        self.mask = mask
+        self.vertices = vertices
+        self.faces = faces
+        self.track = track
+    def write(self, output, mesh_format="stl", track=False):
+        """Write the terrain (or the track tube) mesh to a path or binary file object."""
+        if track and self.track is None:
+            raise ValueError("The model has no track mesh; build it with export_track_stl=True")
+        vertices, faces = self.track if track else (self.vertices, self.faces)
+        if mesh_format == "stl":
+            writer = _StlWriter(output)
+        else:
+            writer = _IndexedMeshWriter(output, mesh_format)
+        with writer:
+            writer.write(vertices, faces)
+    def to_bytes(self, mesh_format="stl", track=False):
+        """Serialize the terrain (or the track tube) mesh in one of MESH_FORMATS."""
+        buffer = io.BytesIO()
+        self.write(buffer, mesh_format, track)
+        return buffer.getvalue()
+class TerrainGenerator:
+    def __init__(self, gpx_file_path, resolution=40, shape="octagon", size=100, 
+                 elevation_multiplier=1.0, track_color="red", track_width=2,
+                 base_thickness=2, output_dir="output", verbose=True,
+                 export_track_stl=False, stream_stl=False, elevation_cache=None,
+                 elevation_cache_size=2000000, elevation_provider=None, mesh_tolerance=None,
+                 grid_size=150, tile_size=512, track_tolerance=0.05, previews="full",
+                 artifact_dir=None, mesh_format="stl", interpolation="linear",
+                 projection="equirectangular"):
+        """
+        Initialize the terrain generator with user settings.
+        Args:
+            gpx_file_path: Path to the GPX file
+            resolution: Number of points along each axis (higher = more detailed but slower)
+            shape: Shape of the terrain ("hexagon", "circle", "rectangle")
+            size: Size of the model in mm
+            elevation_multiplier: Factor to multiply elevation values
+            track_color: Color of the track line
+            track_width: Width of the track line
+            base_thickness: Minimum thickness of the base in mm
+            output_dir: Directory to save output files
+            verbose: Whether to print progress messages
+            export_track_stl: Whether to export the track as a STL file
+            stream_stl: Whether to write binary STL files in chunks instead of building the mesh in memory
+            elevation_cache: Path of the SQLite elevation cache (None disables caching)
+            elevation_cache_size: Maximum number of elevation samples kept in the cache
+            elevation_provider: ElevationProvider to sample terrain heights from (defaults to OpenTopoData)
+            mesh_tolerance: Vertical tolerance in mm for adaptive meshing (None keeps the full grid)
+            grid_size: Number of STL grid samples along each axis
+            tile_size: Number of grid cells per tile side when processing large grids
+            track_tolerance: Maximum deviation in mm of the simplified track from the recorded one (0 keeps every point)
+            previews: Preview PNGs to render alongside the STL: "none", "fast" (100 dpi) or "full" (300 dpi)
+            artifact_dir: Directory caching the output of each pipeline stage between runs (None disables it)
+            mesh_format: Output mesh format: "stl", "3mf", "ply" or "obj"
+            interpolation: Resampling of the elevation lattice onto the STL grid: "linear" or "cubic"
+            projection: Map projection of latitude/longitude: "equirectangular" or "enu" (accurate for large tracks)
+        """
+        self.gpx_file_path = gpx_file_path
+        self.resolution = resolution
+        self.shape = shape
+        self.size = size
+        self.elevation_multiplier = elevation_multiplier
+        self.track_color = track_color
+        self.track_width = track_width
+        self.base_thickness = base_thickness
+        self.output_dir = output_dir
+        self.verbose = verbose
+        self.export_track_stl = export_track_stl
+        self.stream_stl = stream_stl
+        self.elevation_cache = elevation_cache
+        self.elevation_cache_size = elevation_cache_size
+        self.elevation_provider = elevation_provider or OpenTopoDataProvider()
+        self.mesh_tolerance = mesh_tolerance
+        self.grid_size = grid_size
+        self.tile_size = tile_size
+        self.track_tolerance = track_tolerance
+        self.previews = previews
+        self.artifact_dir = artifact_dir
+        self.mesh_format = mesh_format
+        self.interpolation = interpolation
+        self.projection = projection
+        self._project = None
+        self._track_xy = None
+        self.track_points = np.zeros(0, dtype=TRACK_DTYPE)
+        self.terrain_points = []
+        self.elevation_data = []
+        self.terrain_mesh = None
+        self.min_lat = float('inf')
+        self.max_lat = float('-inf')
+        self.min_lon = float('inf')
+        self.max_lon = float('-inf')
+        self.min_ele = float('inf')
+        self.max_ele = float('-inf')
+        self.error = None
+        self.profile = {}
+        self._track_index = None
+        self._artifact_keys = {}
+    def log(self, message):
+        """Print message if verbose mode is enabled."""
+        if self.verbose:
+            print(message)
+    @contextlib.contextmanager
+    def _stage(self, name, memory=True):
+        """
+        Accumulate the wall time of a pipeline stage in self.profile.
+        While tracemalloc is tracing, the peak traced memory of the stage is
+        recorded as well. Stages must not be nested, and stages running on a
+        background thread pass memory=False since the peak is process-wide.
+        """
+        tracing = memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.profile.setdefault(name, {"seconds": 0.0, "calls": 0, "peak_mb": None})
+            stats["seconds"] += time.perf_counter() - start
+            stats["calls"] += 1
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                stats["peak_mb"] = max(stats["peak_mb"] or 0.0, peak)
+    def _artifact_path(self, stage, parent, inputs):
+        """
+        Return the artifact file caching a stage's output, or None if there is none.
+        The file name hashes the stage inputs together with the key of the
+        stage it builds on, so changing anything upstream invalidates it.
+        """
+        if not self.artifact_dir or (parent is not None and parent not in self._artifact_keys):
+            self._artifact_keys.pop(stage, None)
+            return None
+        inputs = dict(inputs, parent=self._artifact_keys.get(parent))
+        key = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:24]
+        self._artifact_keys[stage] = key
+        return os.path.join(self.artifact_dir, f"{stage}-{key}.npy")
+    def _load_artifact(self, path, mmap_mode=None):
+        """Load a cached stage output, or return None if it does not exist yet."""
+        if path is None or not os.path.exists(path):
+            return None
+        self.log(f"Reusing {os.path.basename(path)}")
+        return np.load(path, mmap_mode=mmap_mode)
+    def _save_artifact(self, path, array):
+        """Store a stage output; written to a temporary file first so readers never see a partial file."""
+        if path is None:
+            return
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(temp_path, path)
+    def read_gpx(self):
+        """Read and parse the GPX file to extract track points."""
+        self.log(f"Reading GPX file: {self.gpx_file_path}")
+        if not os.path.exists(self.gpx_file_path):
+            raise FileNotFoundError(f"GPX file not found: {self.gpx_file_path}")
+        self._track_index = None
+        artifact = None
+        if self.artifact_dir:
+            artifact = self._artifact_path("track", None, {"gpx": _file_digest(self.gpx_file_path)})
+        self.track_points = self._load_artifact(artifact)
+        if self.track_points is None:
+            self.track_points = read_track_points(self.gpx_file_path)
+            if len(self.track_points):
+                self._save_artifact(artifact, self.track_points)
+        if not len(self.track_points):
+            raise ValueError("No track points found in the GPX file")
+        self.min_lat, self.max_lat = float(self.track_points['lat'].min()), float(self.track_points['lat'].max())
+        self.min_lon, self.max_lon = float(self.track_points['lon'].min()), float(self.track_points['lon'].max())
+        self.min_ele, self.max_ele = float(self.track_points['ele'].min()), float(self.track_points['ele'].max())
+        self.log(f"Loaded {len(self.track_points)} track points")
+        self._project = Projection(self.min_lat, self.max_lat, self.min_lon, self.max_lon, self.projection)
+        self._track_xy = np.column_stack(self._project(self.track_points['lat'], self.track_points['lon']))
+        self._simplify_track()
+        self.log(f"Latitude range: {self.min_lat:.6f} to {self.max_lat:.6f}")
+        self.log(f"Longitude range: {self.min_lon:.6f} to {self.max_lon:.6f}")
+        self.log(f"Elevation range: {self.min_ele:.2f}m to {self.max_ele:.2f}m")
+    def _simplify_track(self):
+        """
+        Drop track points that do not change the track at model scale.
+        The tolerance is converted to metres using the track extent; the
+        terrain is never smaller than the track, so the deviation in the
+        final model stays below track_tolerance millimetres.
+        """
+        if not self.track_tolerance or len(self.track_points) < 3:
+            return
+        x, y = self._track_xy.T
+        extent = max(x.max() - x.min(), y.max() - y.min())
+        if extent <= 0:
+            return
+        keep = _simplify_polyline(x, y, self.track_tolerance * extent / self.size)
+        self.log(f"Simplified track to {keep.sum()} of {len(keep)} points "
+                 f"(tolerance {self.track_tolerance} mm)")
+        self.track_points = self.track_points[keep]
+        self._track_xy = self._track_xy[keep]
+    def generate_boundary_shape(self):
+        """Generate the boundary shape around the track."""
+        artifact = self._artifact_path("grid", "track", {"shape": self.shape, "resolution": self.resolution})
+        cached = self._load_artifact(artifact)
+        if cached is not None:
+            self.terrain_points = list(map(tuple, cached.tolist()))
+            self.log(f"Loaded {len(self.terrain_points)} terrain points")
+            return
+        self._generate_boundary_points()
+        self._save_artifact(artifact, np.asarray(self.terrain_points, dtype=float).reshape(-1, 2))
+    def _generate_boundary_points(self):
+        """Sample the terrain points inside the boundary shape."""
+        self.terrain_points = []
+        self.log(f"Generating {self.shape} boundary with resolution {self.resolution}...")
+        center_lat = (self.min_lat + self.max_lat) / 2
+        center_lon = (self.min_lon + self.max_lon) / 2
+        lat_radius = (self.max_lat - self.min_lat) / 2 * 1.2
+        lon_radius = (self.max_lon - self.min_lon) / 2 * 1.2
+        radius = max(lat_radius, lon_radius)
+        if self.shape == "octagon":
+            vertices = []
+            for i in range(8):
+                angle = 2 * math.pi * i / 8
+                lat = center_lat + radius * math.cos(angle)
+                lon = center_lon + radius * math.sin(angle)
+                vertices.append((lat, lon))
+            self._generate_grid_in_polygon(vertices)
+        elif self.shape == "hexagon":
+            vertices = []
+            for i in range(6):
+                angle = 2 * math.pi * i / 6
+                lat = center_lat + radius * math.cos(angle)
+                lon = center_lon + radius * math.sin(angle)
+                vertices.append((lat, lon))
+            self._generate_grid_in_polygon(vertices)
+        elif self.shape == "circle":
+            step = radius / self.resolution
+            offsets = np.arange(-self.resolution, self.resolution + 1) * step
+            lat, lon = np.meshgrid(center_lat + offsets, center_lon + offsets, indexing='ij')
+            inside = ((lat - center_lat) / lat_radius) ** 2 + ((lon - center_lon) / lon_radius) ** 2 <= 1
+            self.terrain_points = list(zip(lat[inside].tolist(), lon[inside].tolist()))
+        elif self.shape == "rectangle":
+            lat_step = 2 * lat_radius / self.resolution
+            lon_step = 2 * lon_radius / self.resolution
+            for i in range(self.resolution + 1):
+                for j in range(self.resolution + 1):
+                    lat = self.min_lat - lat_radius * 0.2 + i * lat_step
+                    lon = self.min_lon - lon_radius * 0.2 + j * lon_step
+                    self.terrain_points.append((lat, lon))
+        else:
+            raise ValueError(f"Unsupported shape: {self.shape}")
+        self.log(f"Generated {len(self.terrain_points)} terrain points")
+    def _generate_grid_in_polygon(self, vertices):
+        """Generate a grid of points within a polygon defined by vertices."""
+        vertices = np.asarray(vertices, dtype=float)
+        min_lat, min_lon = vertices.min(axis=0)
+        max_lat, max_lon = vertices.max(axis=0)
+        step_lat = (max_lat - min_lat) / (self.resolution - 1)
+        step_lon = (max_lon - min_lon) / (self.resolution - 1)
+        steps = np.arange(self.resolution)
+        lat, lon = np.meshgrid(min_lat + step_lat * steps, min_lon + step_lon * steps, indexing='ij')
+        inside = _points_in_convex_polygon(lat, lon, vertices)
+        self.terrain_points.extend(zip(lat[inside].tolist(), lon[inside].tolist()))
+    def fetch_elevation_data(self):
+        """Fetch elevation data for all terrain points."""
+        self.log("Fetching elevation data...")
+        provider = self.elevation_provider
+        source = getattr(provider, "base_url", None) or getattr(provider, "directory", None)
+        artifact = self._artifact_path("elevation", "grid", {"provider": type(provider).__name__,
+                                                             "dataset": provider.name, "source": source})
+        cached = self._load_artifact(artifact)
+        if cached is not None:
+            elevations = [None if math.isnan(elevation) else elevation for elevation in cached.tolist()]
+        else:
+            elevations, complete = self._fetch_elevations()
+            # Batches estimated from the track are not worth keeping; fetch them again next time.
+            if complete:
+                self._save_artifact(artifact, np.array(elevations, dtype=float))
+            else:
+                self._artifact_keys.pop("elevation", None)
+        # Data voids (e.g. SRTM holes over steep terrain) are estimated like failed batches.
+        missing = [index for index, elevation in enumerate(elevations) if elevation is None]
+        if missing:
+            self.log(f"Estimating {len(missing)} void elevations from the track")
+            self._fill_from_track(missing, elevations)
+        self.elevation_data = [(lat, lon, elevation)
+                               for (lat, lon), elevation in zip(self.terrain_points, elevations)]
+        known = [elevation for elevation in elevations if elevation is not None]
+        if known:
+            self.min_ele = min(self.min_ele, min(known))
+            self.max_ele = max(self.max_ele, max(known))
+        self.log(f"Fetched elevation data for {len(self.elevation_data)} points")
+        self.log(f"Elevation range: {self.min_ele:.2f}m to {self.max_ele:.2f}m")
+    def _fetch_elevations(self):
+        """
+        Sample every terrain point from the elevation cache and provider.
+        Returns (elevations, complete); complete is False when some batches
+        failed and were estimated from the track instead.
+        """
+        provider = self.elevation_provider
+        elevations = [None] * len(self.terrain_points)
+        pending = list(range(len(self.terrain_points)))
+        cache = None
+        if self.elevation_cache and provider.cacheable:
+            cache = ElevationCache(self.elevation_cache, dataset=provider.name,
+                                   max_entries=self.elevation_cache_size)
+            cached = cache.get_many(self.terrain_points)
+            for index, elevation in cached.items():
+                elevations[index] = elevation
+            pending = [index for index in pending if index not in cached]
+            self.log(f"Elevation cache: {cache.hits} hits, {cache.misses} misses")
+        complete = True
+        try:
+            batch_size = provider.batch_size or max(len(pending), 1)
+            batches = [pending[i:i+batch_size] for i in range(0, len(pending), batch_size)]
+            points = [[self.terrain_points[index] for index in batch] for batch in batches]
+            done = 0
+            for number, results, error in provider.fetch_batches(points):
+                batch_indices = batches[number]
+                if error is None and len(results) != len(batch_indices):
+                    error = ValueError(f"Expected {len(batch_indices)} elevations, got {len(results)}")
+                if error is not None:
+                    self.log(f"Error fetching elevation data: {error}")
+                    self._fill_from_track(batch_indices, elevations)
+                    complete = False
+                    continue
+                for index, elevation in zip(batch_indices, results):
+                    elevations[index] = elevation
+                if cache is not None:
+                    cache.put_many(points[number], results)
+                done += len(batch_indices)
+                self.log(f"Fetched {len(batch_indices)} points ({done}/{len(pending)})")
+        finally:
+            if cache is not None:
+                cache.close()
+        return elevations, complete
+    def _fill_from_track(self, indices, elevations, neighbors=8):
+        """
+        Estimate elevations for terrain points that could not be fetched.
+        Uses inverse-distance weighting over the nearest track points, found
+        through a KD-tree that is built once per run.
+        """
+        from scipy.spatial import cKDTree
+        if self._track_index is None:
+            self._track_index = (cKDTree(self._track_xy), self.track_points['ele'])
+        tree, track_elevations = self._track_index
+        points = np.asarray([self.terrain_points[index] for index in indices], dtype=float)
+        k = min(neighbors, len(track_elevations))
+        distance, nearest = tree.query(np.column_stack(self._project(points[:, 0], points[:, 1])), k=k)
+        distance = distance.reshape(len(points), k)
+        nearest = nearest.reshape(len(points), k)
+        with np.errstate(divide='ignore'):
+            weights = 1 / distance ** 2
+        exact = np.isinf(weights)
+        weights[exact.any(axis=1)] = exact[exact.any(axis=1)]
+        estimate = (weights * track_elevations[nearest]).sum(axis=1) / weights.sum(axis=1)
+        for index, elevation in zip(indices, estimate.tolist()):
+            elevations[index] = elevation
+    def generate_3d_model(self):
+        """Generate a 3D model from the elevation data."""
+        self.log("Generating 3D model...")
+        x_scaled, y_scaled, z_scaled, track_x, track_y, track_z = self._model_coordinates()
+        base_filename = os.path.splitext(os.path.basename(self.gpx_file_path))[0]
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            rendering = None
+            if self.previews != "none":
+                rendering = executor.submit(self._render_previews, x_scaled, y_scaled, z_scaled,
+                                            track_x, track_y, track_z, base_filename)
+            self._create_stl_file(x_scaled, y_scaled, z_scaled, track_x, track_y, base_filename)
+            if self.export_track_stl and len(self.track_points):
+                with self._stage("track_stl"):
+                    self._create_track_stl_file(x_scaled, y_scaled, z_scaled, 
+                                                track_x, track_y, track_z, base_filename)
+            if rendering is not None:
+                rendering.result()
+    def _model_coordinates(self):
+        """
+        Scale the elevation samples and the track to model millimetres.
+        Returns (x_scaled, y_scaled, z_scaled, track_x, track_y, track_z) as
+        arrays; the track arrays are None when there is no track. Every later
+        stage works on these arrays instead of projecting coordinates again.
+        """
+        lat, lon, elevation = np.asarray(self.elevation_data, dtype=float).T
+        # One sample without an elevation must not turn the whole surface into NaN.
+        known = np.isfinite(elevation)
+        if not known.any():
+            raise ValueError("No elevation data available for the terrain")
+        lat, lon, elevation = lat[known], lon[known], elevation[known]
+        x_values, y_values = self._project(lat, lon)
+        z_values = elevation * self.elevation_multiplier
+        x_min, x_max = x_values.min(), x_values.max()
+        y_min, y_max = y_values.min(), y_values.max()
+        z_min = z_values.min()
+        scale_xy = self.size / max(x_max - x_min, y_max - y_min)
+        x_scaled = (x_values - x_min) * scale_xy
+        y_scaled = (y_values - y_min) * scale_xy
+        scale_z = self.size / 10
+        z_scaled = self.base_thickness + (z_values - z_min) * scale_z
+        track_x = track_y = track_z = None
+        if len(self.track_points):
+            track_x = (self._track_xy[:, 0] - x_min) * scale_xy
+            track_y = (self._track_xy[:, 1] - y_min) * scale_xy
+            track_z = self.base_thickness + (self.track_points['ele'] - z_min) * scale_z
+        return x_scaled, y_scaled, z_scaled, track_x, track_y, track_z
+    def _render_previews(self, x_scaled, y_scaled, z_scaled, track_x, track_y, track_z, base_filename):
+        """
+        Render the preview PNGs while the STL is being generated.
+        Only matplotlib's object-oriented Figure API is used, which keeps no
+        global state and is safe to drive from a background thread.
+        """
+        dpi = 300 if self.previews == "full" else 100
+        with self._stage("preview_render", memory=False):
+            self._create_3d_preview(x_scaled, y_scaled, z_scaled, track_x, track_y, track_z,
+                                    base_filename, dpi)
+        with self._stage("heatmap_render", memory=False):
+            self._create_2d_heatmap(x_scaled, y_scaled, z_scaled, track_x, track_y, base_filename, dpi)
+    def _create_3d_preview(self, x_scaled, y_scaled, z_scaled, track_x, track_y, track_z, base_filename, dpi):
+        """Create a 3D scatter preview of the sampled terrain and the track."""
+        from matplotlib.figure import Figure
+        from mpl_toolkits.mplot3d import Axes3D
+        fig = Figure(figsize=(10, 8))
+        ax = fig.add_subplot(111, projection='3d')
+        scatter = ax.scatter(x_scaled, y_scaled, z_scaled, 
+                       c=z_scaled, cmap='terrain', 
+                       s=20, alpha=0.8)
+        cbar = fig.colorbar(scatter, ax=ax, label='Elevation (mm)')
+        if track_x is not None:
+            ax.plot(track_x, track_y, track_z, color=self.track_color, 
+                    linewidth=self.track_width, label='Track')
+            ax.legend()
+        ax.set_xlabel('X (mm)')
+        ax.set_ylabel('Y (mm)')
+        ax.set_zlabel('Z (mm)')
+        ax.set_title('3D Terrain Model')
+        output_file = os.path.join(self.output_dir, f"{base_filename}_terrain_preview.png")
+        fig.savefig(output_file, dpi=dpi)
+        self.log(f"3D model preview saved as {output_file}")
+    def _create_2d_heatmap(self, x_scaled, y_scaled, z_scaled, track_x, track_y, base_filename, dpi):
+        """Create a 2D heatmap showing elevation with top-down view."""
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(10, 8))
+        ax = fig.add_subplot(111)
+        scatter = ax.scatter(x_scaled, y_scaled, c=z_scaled, cmap='terrain', s=20, alpha=0.8)
+        cbar = fig.colorbar(scatter, ax=ax, label='Elevation (mm)')
+        if track_x is not None:
+            ax.plot(track_x, track_y, color=self.track_color, 
+                    linewidth=self.track_width, label='Track')
+            ax.legend()
+        ax.set_xlabel('X (mm)')
+        ax.set_ylabel('Y (mm)')
+        ax.set_title('Terrain Elevation Heatmap')
+        ax.set_aspect('equal')
+        output_file = os.path.join(self.output_dir, f"{base_filename}_terrain_heatmap.png")
+        fig.savefig(output_file, dpi=dpi)
+        self.log(f"2D heatmap saved as {output_file}")
+    def _create_stl_file(self, x_scaled, y_scaled, z_scaled, track_x, track_y, base_filename):
+        """Create an STL file for 3D printing with proper terrain scaling."""
+        self.log("Generating STL file with realistic terrain heights...")
+        try:
+            grid_size = self.grid_size
+            _, _, tiles = self._terrain_mesh(x_scaled, y_scaled, z_scaled, track_x, track_y)
+            tile_count = len(list(_grid_tiles(grid_size, grid_size, self.tile_size)))
+            output_file = os.path.join(self.output_dir, f"{base_filename}_terrain_model.{self.mesh_format}")
+            if self.mesh_format != "stl":
+                self.log(f"Writing {grid_size}x{grid_size} grid as an indexed {self.mesh_format.upper()} mesh "
+                         f"({tile_count} tiles)...")
+                with _IndexedMeshWriter(output_file, self.mesh_format) as writer:
+                    # _terrain_tiles yields the tiles in _grid_tiles order.
+                    for (vertices, faces, ids), (r0, r1, _, c1) in zip(
+                            tiles, _grid_tiles(grid_size, grid_size, self.tile_size)):
+                        with self._stage("mesh_write"):
+                            writer.write(vertices, faces, ids, _tile_seams(grid_size, grid_size, r0, r1, c1))
+                self.log(f"Wrote {self.mesh_format.upper()} mesh with {writer.vertex_count} vertices and "
+                         f"{writer.face_count} faces ({_format_size(os.path.getsize(output_file))})")
+            elif self.stream_stl or tile_count > 1:
+                self.log(f"Streaming {grid_size}x{grid_size} grid as {tile_count} tiles...")
+                vertex_total = face_total = 0
+                with _StlWriter(output_file) as writer:
+                    for vertices, faces, _ in tiles:
+                        with self._stage("mesh_write"):
+                            writer.write(vertices, faces)
+                        vertex_total += len(vertices)
+                        face_total += len(faces)
+                self.log(f"Wrote STL mesh with {vertex_total} vertices and {face_total} faces "
+                         f"({_format_size(84 + 50 * face_total)} as binary STL)")
+            else:
+                vertices, faces, _ = next(tiles)
+                self.log(f"Creating STL mesh with {len(vertices)} vertices and {len(faces)} faces "
+                         f"({_format_size(84 + 50 * len(faces))} as binary STL)")
+                with self._stage("mesh_write"):
+                    self._save_mesh(vertices, faces, output_file)
+            self.log(f"{self.mesh_format.upper()} file saved as {output_file}")
+        except Exception as e:
+            self.log(f"Error creating STL file: {e}")
+            import traceback
+            self.log(traceback.format_exc())
+            self.log("Falling back to simplified terrain model...")
+            try:
+                grid_size = 20
+                x_min, y_min = x_scaled.min(), y_scaled.min()
+                x_range = x_scaled.max() - x_min
+                y_range = y_scaled.max() - y_min
+                steps = np.arange(grid_size)
+                X, Y = np.meshgrid(x_min + steps * x_range / (grid_size-1),
+                                   y_min + steps * y_range / (grid_size-1))
+                I, J = np.meshgrid(steps, steps)
+                dist = ((I - grid_size/2)**2 + (J - grid_size/2)**2) / ((grid_size/2)**2)
+                Z = self.base_thickness + np.where(dist < 1, (1 - dist) * self.size / 10, 0)
+                vertices, faces, _ = _grid_surface(X, Y, Z, np.ones((grid_size, grid_size), dtype=bool))
+                vertices, faces = _solidify(vertices, faces)
+                output_file = os.path.join(self.output_dir, f"{base_filename}_terrain_model.{self.mesh_format}")
+                self._save_mesh(vertices, faces, output_file)
+                self.log(f"Simplified STL file saved as {output_file}")
+            except Exception as e:
+                self.log(f"Error creating simplified STL file: {e}")
+                import traceback
+                self.log(traceback.format_exc())
+    def _terrain_mesh(self, x_scaled, y_scaled, z_scaled, track_x, track_y, heightmap=None, mask=None):
+        """
+        Set up the terrain grid, height field and track embossing.
+        Returns (x_grid, y_grid, tiles) where tiles is the generator of closed
+        mesh tiles from _terrain_tiles; the optional heightmap and mask arrays
+        are filled in as tiles are built.
+        """
+        grid_size = self.grid_size
+        min_x, max_x = x_scaled.min(), x_scaled.max()
+        min_y, max_y = y_scaled.min(), y_scaled.max()
+        x_grid = np.linspace(min_x, max_x, grid_size)
+        y_grid = np.linspace(min_y, max_y, grid_size)
+        center_x = (min_x + max_x) / 2
+        center_y = (min_y + max_y) / 2
+        width = max_x - min_x
+        height = max_y - min_y
+        radius = max(width, height) / 2 * 1.15
+        boundary = self._stl_boundary(center_x, center_y, radius,
+                                      min_x, max_x, min_y, max_y, margin=0.075)
+        points_outside = (track_x is not None and
+                          not _points_in_convex_polygon(track_x, track_y, boundary).all())
+        if points_outside:
+            self.log("Track extends beyond initial boundary shape. Increasing boundary size.")
+            radius *= 1.25
+            boundary = self._stl_boundary(center_x, center_y, radius,
+                                          min_x, max_x, min_y, max_y, margin=0.15)
+        # The field is interpolated in size-independent units, so a cached
+        # field can be reused when only the model size or base thickness change.
+        points = np.column_stack((x_scaled, y_scaled)) / self.size
+        min_z = z_scaled.min()
+        z_range = z_scaled.max() - min_z
+        with self._stage("interpolation"):
+            field = self._terrain_field(x_grid / self.size, y_grid / self.size, points,
+                                        (z_scaled - min_z) / z_range)
+        def surface(r0, r1, c0, c1):
+            return self.base_thickness + self.size * 0.10 * field(r0, r1, c0, c1)
+        track_width = width / 40
+        track_height = 0.8
+        track_distance = None
+        if not self.export_track_stl and track_x is not None:
+            with self._stage("embossing"):
+                track_distance = _PolylineDistance(track_x, track_y, track_width)
+        tiles = self._terrain_tiles(x_grid, y_grid, boundary, surface,
+                                    track_distance, track_width, track_height, heightmap, mask)
+        return x_grid, y_grid, tiles
+    def _height_interpolator(self, points, values):
+        """
+        Return a function mapping grid coordinates to terrain heights.
+        The elevation samples lie on a regular lat/lon lattice, so they are
+        put back into it and resampled with a RegularGridInterpolator
+        (bilinear, or bicubic with interpolation="cubic"). Samples that do not
+        form a lattice are interpolated linearly over a Delaunay triangulation
+        instead, using the nearest sample outside their convex hull.
+        Either way the interpolator is built once and reused for every tile.
+        """
+        lattice = _lattice(points, values)
+        if lattice is not None:
+            from scipy.interpolate import RegularGridInterpolator
+            axes, grid = lattice
+            method = self.interpolation
+            if min(grid.shape) < 4:
+                method = "linear"
+            regular = RegularGridInterpolator(axes, grid, method=method, bounds_error=False, fill_value=None)
+            return lambda X, Y: regular((Y, X))
+        from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator
+        linear = LinearNDInterpolator(points, values)
+        nearest = []
+        def heights(X, Y):
+            Z = linear(X, Y)
+            missing = np.isnan(Z)
+            if missing.any():
+                if not nearest:
+                    nearest.append(NearestNDInterpolator(points, values))
+                Z[missing] = nearest[0](X[missing], Y[missing])
+            return Z
+        return heights
+    def _terrain_field(self, x_grid, y_grid, points, values):
+        """
+        Return field(r0, r1, c0, c1), the smoothed interpolated heights of an
+        inclusive range of grid rows and columns.
+        Each range is interpolated and smoothed on a window with a halo wide
+        enough for gaussian_filter, so its heights match a whole-grid pass.
+        With an artifact directory the whole field is computed once into a
+        memory-mapped .npy file, and later runs only read slices of it.
+        """
+        from scipy.ndimage import gaussian_filter
+        rows, cols = len(y_grid), len(x_grid)
+        artifact = self._artifact_path("field", "elevation", {"grid_size": [rows, cols],
+                                                              "inverted": self.elevation_multiplier < 0,
+                                                              "interpolation": self.interpolation,
+                                                              "projection": self.projection})
+        stored = self._load_artifact(artifact, mmap_mode='r')
+        if stored is None:
+            heights = self._height_interpolator(points, values)
+            halo = 2
+            def field(r0, r1, c0, c1):
+                wr0, wr1 = max(r0 - halo, 0), min(r1 + halo, rows - 1)
+                wc0, wc1 = max(c0 - halo, 0), min(c1 + halo, cols - 1)
+                X, Y = np.meshgrid(x_grid[wc0:wc1 + 1], y_grid[wr0:wr1 + 1])
+                Z = gaussian_filter(heights(X, Y), sigma=0.5)
+                return Z[r0 - wr0:r1 - wr0 + 1, c0 - wc0:c1 - wc0 + 1]
+            if artifact is None:
+                return field
+            os.makedirs(self.artifact_dir, exist_ok=True)
+            temp_path = f"{artifact}.{os.getpid()}.tmp"
+            stored = np.lib.format.open_memmap(temp_path, mode='w+', dtype=float, shape=(rows, cols))
+            for r0, r1, c0, c1 in _grid_tiles(rows, cols, self.tile_size):
+                stored[r0:r1 + 1, c0:c1 + 1] = field(r0, r1, c0, c1)
+            stored.flush()
+            del stored
+            os.replace(temp_path, artifact)
+            stored = np.load(artifact, mmap_mode='r')
+        return lambda r0, r1, c0, c1: stored[r0:r1 + 1, c0:c1 + 1]
+    def _terrain_tiles(self, x_grid, y_grid, boundary, surface, track_distance, track_width, track_height,
+                       heightmap=None, mask_grid=None):
+        """
+        Yield the closed terrain mesh tile by tile as (vertices, faces, ids),
+        where ids number every vertex uniquely across all tiles.
+        surface(r0, r1, c0, c1) supplies the heights of each tile. Skirt edges
+        are found against a one-cell ring of neighbouring faces, so seams
+        between tiles are never walled off. Embossed heights (NaN outside the
+        boundary) and the inside mask are copied into heightmap and mask_grid
+        when given.
+        """
+        rows, cols = len(y_grid), len(x_grid)
+        for r0, r1, c0, c1 in _grid_tiles(rows, cols, self.tile_size):
+            wr0, wr1 = max(r0 - 1, 0), min(r1 + 1, rows - 1)
+            wc0, wc1 = max(c0 - 1, 0), min(c1 + 1, cols - 1)
+            with self._stage("interpolation"):
+                X, Y = np.meshgrid(x_grid[wc0:wc1 + 1], y_grid[wr0:wr1 + 1])
+                inside = _points_in_convex_polygon(X, Y, boundary)
+                tile = (slice(r0 - wr0, r1 - wr0 + 1), slice(c0 - wc0, c1 - wc0 + 1))
+                X_tile, Y_tile, mask = X[tile], Y[tile], inside[tile]
+                Z_tile = surface(r0, r1, c0, c1)
+            if track_distance is not None:
+                with self._stage("embossing"):
+                    min_dist = track_distance(X_tile[mask], Y_tile[mask])
+                    near = min_dist < track_width
+                    emboss = np.zeros(len(min_dist))
+                    emboss[near] = track_height * (1 - min_dist[near] / track_width)
+                    Z_tile[mask] += emboss
+            if heightmap is not None:
+                heightmap[r0:r1 + 1, c0:c1 + 1] = np.where(mask, Z_tile, np.nan)
+                mask_grid[r0:r1 + 1, c0:c1 + 1] = mask
+            with self._stage("meshing"):
+                if self.mesh_tolerance:
+                    pinned = np.zeros_like(mask)
+                    pinned[0, :] |= r0 > 0
+                    pinned[-1, :] |= r1 < rows - 1
+                    pinned[:, 0] |= c0 > 0
+                    pinned[:, -1] |= c1 < cols - 1
+                    vertices, faces, vertex_indices = _adaptive_grid_surface(
+                        X_tile, Y_tile, Z_tile, mask, self.mesh_tolerance, pinned & mask)
+                else:
+                    vertices, faces, vertex_indices = _grid_surface(X_tile, Y_tile, Z_tile, mask)
+                global_ids = np.arange(r0, r1 + 1)[:, None] * cols + np.arange(c0, c1 + 1)
+                global_ids = global_ids[vertex_indices >= 0]
+                ring_cells = inside[:-1, :-1] & inside[:-1, 1:] & inside[1:, :-1] & inside[1:, 1:]
+                ring_cells[r0 - wr0:r1 - wr0, c0 - wc0:c1 - wc0] = False
+                ci, cj = np.nonzero(ring_cells)
+                g1 = (ci + wr0) * cols + cj + wc0
+                g3 = g1 + cols
+                ring_faces = np.stack((np.column_stack((g1, g1 + 1, g3)),
+                                       np.column_stack((g3, g1 + 1, g3 + 1))), axis=1).reshape(-1, 3)
+                context = np.vstack((global_ids[faces], ring_faces))
+                edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+                boundary_edges = edges[_boundary_edges(context, owned=len(faces))]
+                vertices, faces = _solidify(vertices, faces, boundary=boundary_edges)
+            yield vertices, faces, np.concatenate((global_ids, global_ids + rows * cols))
+    def _save_mesh(self, vertices, faces, output_file):
+        """Write an indexed triangle mesh (vertex array + face index array) in the configured format."""
+        if self.mesh_format != "stl":
+            with _IndexedMeshWriter(output_file, self.mesh_format) as writer:
+                writer.write(vertices, faces)
+            return
+        if self.stream_stl:
+            _write_binary_stl(output_file, vertices, faces)
+            return
+        from stl import mesh
+        result = mesh.Mesh(np.zeros(len(faces), dtype=mesh.Mesh.dtype))
+        result.vectors[:] = vertices[faces]
+        result.save(output_file)
+    def _stl_boundary(self, center_x, center_y, radius, min_x, max_x, min_y, max_y, margin):
+        """Return the model-space boundary polygon vertices for the configured shape."""
+        if self.shape == "octagon":
+            return _regular_polygon(center_x, center_y, radius, 8)
+        if self.shape == "hexagon":
+            return _regular_polygon(center_x, center_y, radius, 6)
+        if self.shape == "circle":
+            return _regular_polygon(center_x, center_y, radius, 32)
+        margin_x = (max_x - min_x) * margin
+        margin_y = (max_y - min_y) * margin
+        return np.array([
+            (min_x - margin_x, min_y - margin_y),
+            (max_x + margin_x, min_y - margin_y),
+            (max_x + margin_x, max_y + margin_y),
+            (min_x - margin_x, max_y + margin_y)
+        ])
+    def _create_track_stl_file(self, x_scaled, y_scaled, z_scaled, track_x, track_y, track_z, base_filename):
+        """Create a separate STL file for just the track."""
+        self.log("Generating track-only STL file...")
+        try:
+            tube = self._track_mesh(z_scaled, track_x, track_y, track_z)
+            if tube is None:
+                self.log("Not enough track points to create a track STL")
+                return
+            vertices, faces = tube
+            self.log(f"Creating track STL mesh with {len(vertices)} vertices and {len(faces)} faces")
+            output_file = os.path.join(self.output_dir, f"{base_filename}_track.{self.mesh_format}")
+            self._save_mesh(vertices, faces, output_file)
+            self.log(f"Track {self.mesh_format.upper()} file saved as {output_file}")
+        except Exception as e:
+            self.log(f"Error creating track STL file: {e}")
+            import traceback
+            self.log(traceback.format_exc())     
+    def _track_mesh(self, z_scaled, track_x, track_y, track_z):
+        """Build the closed track tube as (vertices, faces), or None if the track is too short."""
+        tube_radius = self.track_width * 0.2
+        tube_segments = 8
+        track_elevation = 0.2
+        min_z = z_scaled.min()
+        z_range = z_scaled.max() - min_z
+        scaled_track_z = (self.base_thickness + (np.asarray(track_z, dtype=float) - min_z) *
+                          (self.size * 0.10 / z_range) + track_elevation)
+        return _tube_mesh(np.column_stack((track_x, track_y, scaled_track_z)), tube_radius, tube_segments)
+    def build_model(self):
+        """
+        Run the pipeline in memory and return a TerrainModel.
+        Nothing is written to output_dir and no previews are rendered;
+        failures raise instead of falling back to a placeholder model.
+        """
+        with self._stage("parse_gpx"):
+            self.read_gpx()
+        with self._stage("terrain_grid"):
+            self.generate_boundary_shape()
+        with self._stage("elevation_fetch"):
+            self.fetch_elevation_data()
+        x_scaled, y_scaled, z_scaled, track_x, track_y, track_z = self._model_coordinates()
+        heightmap = np.empty((self.grid_size, self.grid_size))
+        mask = np.empty((self.grid_size, self.grid_size), dtype=bool)
+        x_grid, y_grid, tiles = self._terrain_mesh(x_scaled, y_scaled, z_scaled, track_x, track_y,
+                                                   heightmap, mask)
+        vertices, faces, ids = zip(*tiles)
+        offsets = np.cumsum([0] + [len(tile) for tile in vertices[:-1]])
+        ids, first, welded = np.unique(np.concatenate(ids), return_index=True, return_inverse=True)
+        vertices = np.vstack(vertices)[first]
+        faces = welded.ravel()[np.vstack([tile + offset for tile, offset in zip(faces, offsets)])]
+        track = None
+        if self.export_track_stl and len(self.track_points):
+            with self._stage("track_stl"):
+                track = self._track_mesh(z_scaled, track_x, track_y, track_z)
+        return TerrainModel(x_grid, y_grid, heightmap, mask, vertices, faces, track)
+    def generate_terrain(self):
+        """Execute the full terrain generation process."""
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with self._stage("parse_gpx"):
+                self.read_gpx()
+            with self._stage("terrain_grid"):
+                self.generate_boundary_shape()
+            with self._stage("elevation_fetch"):
+                self.fetch_elevation_data()
+            self.generate_3d_model()
+            self.log("Terrain generation complete!")
+            return True
+        except Exception as e:
+            self.error = e
+            self.log(f"Error generating terrain: {e}")
+            return False
+def _create_generator(gpx_file, args, verbose, limiter=None):
+    """Create a TerrainGenerator for one GPX file from parsed command line arguments."""
+    if args.hgt_dir:
+        provider = HGTProvider(args.hgt_dir)
+    else:
+        provider = OpenTopoDataProvider(
+            base_url=args.elevation_url,
+            concurrency=args.fetch_workers,
+            requests_per_second=args.requests_per_second or None,
+            retries=args.fetch_retries,
+            limiter=limiter
+        )
+    return TerrainGenerator(
+        gpx_file_path=gpx_file,
+        resolution=args.resolution,
+        shape=args.shape,
+        size=args.size,
+        elevation_multiplier=args.elevation_multiplier,
+        track_color=args.track_color,
+        track_width=args.track_width,
+        base_thickness=args.base_thickness,
+        output_dir=args.output_dir,
+        verbose=verbose,
+        export_track_stl=args.export_track_stl,
+        stream_stl=args.stream_stl,
+        elevation_cache=None if args.no_elevation_cache else args.elevation_cache,
+        elevation_cache_size=args.elevation_cache_size,
+        elevation_provider=provider,
+        mesh_tolerance=args.mesh_tolerance,
+        grid_size=args.grid_size,
+        tile_size=args.tile_size,
+        track_tolerance=args.track_tolerance,
+        previews=args.previews,
+        artifact_dir=args.artifact_dir,
+        mesh_format=args.format,
+        interpolation=args.interpolation,
+        projection=args.projection
+    )
+def _collect_gpx_files(path):
+    """Expand a GPX path, directory or glob pattern into a sorted list of files."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if name.lower().endswith(".gpx"))
+    if glob.has_magic(path):
+        return sorted(glob.glob(path))
+    return [path]
+_batch_limiter = None
+def _init_batch_worker(limiter):
+    """Install the request limiter shared by all batch worker processes."""
+    global _batch_limiter
+    _batch_limiter = limiter
+def _profile_entry(gpx_file, success, seconds, profile):
+    """Describe one terrain run for the profile report."""
+    traced = [stats["peak_mb"] for stats in profile.values() if stats["peak_mb"] is not None]
+    return {
+        "gpx_file": gpx_file,
+        "success": success,
+        "seconds": seconds,
+        "peak_mb": max(traced) if traced else None,
+        "stages": profile,
+    }
+def _write_profile_report(path, runs):
+    """Write per-stage timings and peak traced memory of every run as JSON."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": runs}, f, indent=2)
+    print(f"Profile report saved as {path}")
+def _run_batch_job(gpx_file, args):
+    """Generate one terrain in a worker process and return (file, success, seconds, error, profile)."""
+    if args.profile_report and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    start = time.time()
+    generator = _create_generator(gpx_file, args, verbose=False, limiter=_batch_limiter)
+    success = generator.generate_terrain()
+    error = None if generator.error is None else str(generator.error)
+    return gpx_file, success, time.time() - start, error, generator.profile
+def _run_batch(gpx_files, args):
+    """Process many GPX files across a process pool and print a per-file summary."""
+    if not gpx_files:
+        print(f"No GPX files found for {args.gpx_file}")
+        return 1
+    workers = max(1, min(args.workers or 1, len(gpx_files)))
+    limiter = _RateLimiter(args.requests_per_second or None, shared=True)
+    print(f"Processing {len(gpx_files)} GPX files with {workers} workers...")
+    start = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                             initargs=(limiter,)) as executor:
+        futures = {executor.submit(_run_batch_job, gpx_file, args): gpx_file for gpx_file in gpx_files}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = (futures[future], False, 0.0, str(e), {})
+            results.append(result)
+            gpx_file, success, seconds, error, _ = result
+            status = "done" if success else "FAILED"
+            print(f"[{len(results)}/{len(gpx_files)}] {status} in {seconds:.1f}s: {gpx_file}")
+    print("Batch summary:")
+    for gpx_file, success, seconds, error, _ in sorted(results, key=lambda result: result[0]):
+        line = f"  {'OK' if success else 'FAILED':<6} {seconds:8.1f}s  {gpx_file}"
+        if error:
+            line += f" ({error})"
+        print(line)
+    succeeded = sum(1 for result in results if result[1])
+    print(f"{succeeded}/{len(results)} files succeeded in {time.time() - start:.1f}s using {workers} workers")
+    if args.profile_report:
+        _write_profile_report(args.profile_report,
+                              [_profile_entry(gpx_file, success, seconds, profile)
+                               for gpx_file, success, seconds, _, profile in sorted(results, key=lambda result: result[0])])
+    return 0 if succeeded == len(results) else 1
+def main():
+    """Main function to handle command line arguments and execute the terrain generation."""
+    parser = argparse.ArgumentParser(
+        description="Generate 3D terrain models from GPX files",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("gpx_file",
+                        help="Path to the GPX file, or a directory / glob pattern to process many files")
+    parser.add_argument("--resolution", type=int, default=40,
+                        help="Resolution of the terrain model (higher = more detailed but slower)")
+    parser.add_argument("--shape", choices=["octagon", "hexagon", "circle", "rectangle"], default="octagon",
+                        help="Shape of the terrain model")
+    parser.add_argument("--size", type=float, default=100,
+                        help="Size of the model in mm")
+    parser.add_argument("--elevation-multiplier", type=float, default=1.0,
+                        help="Factor to multiply elevation values")
+    parser.add_argument("--track-color", default="red",
+                        help="Color of the track line")
+    parser.add_argument("--track-width", type=float, default=2,
+                        help="Width of the track line")
+    parser.add_argument("--base-thickness", type=float, default=2,
+                        help="Minimum thickness of the base in mm")
+    parser.add_argument("--output-dir", default="output",
+                        help="Directory to save output files")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Run in quiet mode (no progress messages)")
+    parser.add_argument("--previews", choices=["none", "fast", "full"], default="full",
+                        help="Preview PNGs rendered alongside the STL (none skips matplotlib entirely)")
+    parser.add_argument("--export-track-stl", action="store_true",
+                        help="Export the track as a separate STL file")
+    parser.add_argument("--format", choices=MESH_FORMATS, default="stl",
+                        help="Mesh file format; 3mf, ply and obj keep shared vertices and are much smaller than STL")
+    parser.add_argument("--stream-stl", action="store_true",
+                        help="Write binary STL files in chunks instead of building the whole mesh in memory")
+    parser.add_argument("--elevation-cache",
+                        default=os.path.join(os.path.expanduser("~"), ".gpx_to_stl", "elevation_cache.sqlite"),
+                        help="SQLite file used to cache fetched elevation samples between runs")
+    parser.add_argument("--elevation-cache-size", type=int, default=2000000,
+                        help="Maximum number of elevation samples kept in the cache")
+    parser.add_argument("--no-elevation-cache", action="store_true",
+                        help="Always fetch elevation data from the provider")
+    parser.add_argument("--artifact-dir",
+                        help="Cache each stage's output (track, terrain grid, elevation, height field) here, "
+                             "so re-runs with tweaked settings only recompute the affected stages")
+    parser.add_argument("--grid-size", type=int, default=150,
+                        help="Number of STL grid samples along each axis")
+    parser.add_argument("--tile-size", type=int, default=512,
+                        help="Grid cells per tile side; larger grids are generated and streamed tile by tile")
+    parser.add_argument("--track-tolerance", type=float, default=0.05,
+                        help="Simplify the track while it stays within this distance in mm of the recorded one (0 keeps every point)")
+    parser.add_argument("--interpolation", choices=["linear", "cubic"], default="linear",
+                        help="How elevation samples are resampled onto the STL grid")
+    parser.add_argument("--projection", choices=PROJECTIONS, default="equirectangular",
+                        help="Map projection; enu stays accurate for tracks spanning hundreds of kilometres")
+    parser.add_argument("--mesh-tolerance", type=float,
+                        help="Adaptive meshing: merge grid cells while the surface stays within this vertical tolerance in mm")
+    parser.add_argument("--hgt-dir",
+                        help="Sample elevation offline from SRTM .hgt tiles in this directory")
+    parser.add_argument("--elevation-url", default="https://api.opentopodata.org/v1",
+                        help="Base URL of the OpenTopoData-compatible elevation API")
+    parser.add_argument("--fetch-workers", type=int, default=4,
+                        help="Number of elevation requests kept in flight at once")
+    parser.add_argument("--requests-per-second", type=float, default=1.0,
+                        help="Elevation API request budget (0 = unlimited)")
+    parser.add_argument("--fetch-retries", type=int, default=3,
+                        help="Retries per elevation batch after throttling or server errors")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of GPX files processed in parallel in batch mode")
+    parser.add_argument("--profile-report",
+                        help="Write per-stage timings and peak memory to this JSON file (memory tracing slows the run)")
+    args = parser.parse_args()
+    gpx_files = _collect_gpx_files(args.gpx_file)
+    if len(gpx_files) != 1 or gpx_files[0] != args.gpx_file:
+        return _run_batch(gpx_files, args)
+    if args.profile_report:
+        tracemalloc.start()
+    start = time.time()
+    generator = _create_generator(args.gpx_file, args, verbose=not args.quiet)
+    success = generator.generate_terrain()
+    if args.profile_report:
+        _write_profile_report(args.profile_report,
+                              [_profile_entry(args.gpx_file, success, time.time() - start, generator.profile)])
+    return 0 if success else 1
+if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
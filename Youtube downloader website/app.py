@@ -1,13 +1,20 @@
 import os
+import math
+import sqlite3
 import time
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import yt_dlp
-from collections import deque
 import threading
+import queue
+from contextlib import contextmanager
 import re
 import subprocess
+import urllib.request
+import uuid
 
 app = FastAPI()
 
@@ -19,7 +26,6 @@ app.add_middleware(
     allow_headers=["*"], 
 )
 
-request_times = deque() 
 DOWNLOAD_FOLDER = "downloads"
 
 if not os.path.exists(DOWNLOAD_FOLDER):
@@ -28,35 +34,339 @@ if not os.path.exists(DOWNLOAD_FOLDER):
 
 RATE_LIMIT = 10  
 TIME_FRAME = 60 
+STATE_DB = os.environ.get("STATE_DB", "app_state.sqlite3")
+API_KEYS = {key.strip() for key in os.environ.get("API_KEYS", "").split(",") if key.strip()}
+
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 2))
+DOWNLOAD_QUEUE_SIZE = int(os.environ.get("DOWNLOAD_QUEUE_SIZE", 20))
+JOB_RETENTION = 600
+STALE_JOB_AGE = 300
+CACHE_TTL = int(os.environ.get("CACHE_TTL", 3600))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 5 * 1024 ** 3))
+MAX_STREAMS = int(os.environ.get("MAX_STREAMS", 4))
+STREAM_CHUNK_SIZE = 64 * 1024
 
 class VideoRequest(BaseModel):
     url: str
     format: str 
 
+class DownloadFailed(Exception):
+    pass
+
+def connect_state_db(path):
+    """Open the SQLite file shared by all uvicorn workers; transactions are managed explicitly."""
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
+
+class TokenBucketLimiter:
+    """
+    Per-client token buckets stored in SQLite, so every uvicorn worker on the
+    host draws from the same budget. Each client may burst `capacity`
+    requests and then gets one more every `period / capacity` seconds.
+    """
+
+    def __init__(self, path, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.lock = threading.Lock()
+        self.connection = connect_state_db(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "client TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def acquire(self, client):
+        """Take one token; return 0 if the request may proceed, else the seconds until a token is available."""
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so workers cannot interleave read and update.
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self.connection.execute(
+                    "SELECT tokens, updated FROM buckets WHERE client = ?", (client,)
+                ).fetchone()
+                tokens = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self.connection.execute(
+                    "INSERT INTO buckets (client, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(client) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (client, tokens, now)
+                )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return 0 if allowed else (1 - tokens) / self.rate
+
+    def prune(self):
+        """Forget clients whose bucket has refilled completely."""
+        with self.lock:
+            self.connection.execute("DELETE FROM buckets WHERE updated < ?",
+                                    (time.time() - self.capacity / self.rate,))
+
+rate_limiter = TokenBucketLimiter(STATE_DB, RATE_LIMIT, TIME_FRAME)
+
+IN_FLIGHT = ("queued", "downloading", "processing")
+
+class JobStore:
+    """
+    Download jobs and the cache of finished files, kept in SQLite so every
+    uvicorn worker can report any job and requests for the same video share
+    one download whichever worker they reach. The worker that accepted a job
+    runs it and records its progress here.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = connect_state_db(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, key TEXT NOT NULL, url TEXT NOT NULL, format TEXT NOT NULL, "
+            "status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, downloaded_bytes INTEGER NOT NULL DEFAULT 0, "
+            "total_bytes INTEGER, speed REAL, eta REAL, file_path TEXT, error TEXT, updated REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, file_path TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def submit(self, url, format, key):
+        """
+        Return (job, enqueue) for a download request: the job already
+        downloading this key, a finished job for a cached file, or a new
+        queued job that the caller must enqueue.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute(
+                f"SELECT * FROM jobs WHERE key = ? AND status IN ({', '.join('?' * len(IN_FLIGHT))}) "
+                "AND updated >= ? ORDER BY updated DESC LIMIT 1",
+                (key, *IN_FLIGHT, now - STALE_JOB_AGE)
+            ).fetchone()
+            if row is not None:
+                return dict(row), False
+            job_id = uuid.uuid4().hex
+            entry = db.execute("SELECT file_path, last_access FROM cache WHERE key = ?", (key,)).fetchone()
+            if entry is not None and entry["last_access"] >= now - CACHE_TTL and os.path.isfile(entry["file_path"]):
+                db.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+                db.execute(
+                    "INSERT INTO jobs (id, key, url, format, status, progress, file_path, updated) "
+                    "VALUES (?, ?, ?, ?, 'finished', 100, ?, ?)",
+                    (job_id, key, url, format, entry["file_path"], now)
+                )
+                enqueue = False
+            else:
+                db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                db.execute(
+                    "INSERT INTO jobs (id, key, url, format, status, updated) VALUES (?, ?, ?, ?, 'queued', ?)",
+                    (job_id, key, url, format, now)
+                )
+                enqueue = True
+            return dict(db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()), enqueue
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else dict(row)
+
+    def update(self, job_id, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.connection.execute(f"UPDATE jobs SET {columns}, updated = ? WHERE id = ?",
+                                    (*fields.values(), time.time(), job_id))
+
+    def fail(self, job_id, error):
+        """Mark a job as failed unless it already finished or failed."""
+        with self.lock:
+            self.connection.execute(
+                f"UPDATE jobs SET status = 'error', error = ?, updated = ? "
+                f"WHERE id = ? AND status IN ({', '.join('?' * len(IN_FLIGHT))})",
+                (error, time.time(), job_id, *IN_FLIGHT)
+            )
+
+    def heartbeat(self, job_ids):
+        """Mark jobs this process still has queued or running as alive."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        with self.lock:
+            self.connection.execute(
+                f"UPDATE jobs SET updated = ? WHERE id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), *job_ids)
+            )
+
+    def finish(self, job_id, key, file_path):
+        now = time.time()
+        with self.transaction() as db:
+            db.execute(
+                "INSERT INTO cache (key, file_path, size, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET file_path = excluded.file_path, size = excluded.size, "
+                "last_access = excluded.last_access",
+                (key, file_path, os.path.getsize(file_path), now)
+            )
+            db.execute("UPDATE jobs SET status = 'finished', progress = 100, file_path = ?, updated = ? WHERE id = ?",
+                       (file_path, now, job_id))
+
+    def touch(self, key):
+        with self.lock:
+            self.connection.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+
+    def evict(self):
+        """
+        Drop downloads nobody asked for within CACHE_TTL, then the least
+        recently used ones above CACHE_MAX_BYTES. Returns the files to delete.
+        """
+        with self.transaction() as db:
+            entries = db.execute("SELECT key, file_path, size, last_access FROM cache "
+                                 "ORDER BY last_access DESC").fetchall()
+            total = 0
+            kept, evicted = set(), []
+            for index, entry in enumerate(entries):
+                total += entry["size"]
+                if entry["last_access"] < time.time() - CACHE_TTL or (total > CACHE_MAX_BYTES and index > 0):
+                    evicted.append(entry)
+                else:
+                    kept.add(entry["file_path"])
+            db.executemany("DELETE FROM cache WHERE key = ?", [(entry["key"],) for entry in evicted])
+        return [entry["file_path"] for entry in evicted if entry["file_path"] not in kept]
+
+    def cached_files(self):
+        with self.lock:
+            return {row["file_path"] for row in self.connection.execute("SELECT file_path FROM cache")}
+
+    def prune(self):
+        """Forget old finished jobs and fail jobs whose worker stopped sending heartbeats."""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("DELETE FROM jobs WHERE status IN ('finished', 'error') AND updated < ?",
+                       (now - JOB_RETENTION,))
+            db.execute(
+                f"UPDATE jobs SET status = 'error', error = 'Download was interrupted. Please try again.', "
+                f"updated = ? WHERE status IN ({', '.join('?' * len(IN_FLIGHT))}) AND updated < ?",
+                (now, *IN_FLIGHT, now - STALE_JOB_AGE)
+            )
+
+job_store = JobStore(STATE_DB)
+
+def job_response(job):
+    response = {
+        "job_id": job["id"],
+        "url": job["url"],
+        "format": job["format"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "downloaded_bytes": job["downloaded_bytes"],
+        "total_bytes": job["total_bytes"],
+        "speed": job["speed"],
+        "eta": job["eta"],
+    }
+    if job["status"] == "finished":
+        response["message"] = f"{job['format'].upper()} downloaded: {job['url']}"
+        response["file_path"] = job["file_path"]
+        response["download_url"] = f"/jobs/{job['id']}/file"
+    if job["status"] == "error":
+        response["detail"] = job["error"]
+    return response
+
+class Job:
+    """Worker-side handle of a queued download that reports its progress to the job store."""
+
+    def __init__(self, job):
+        self.id = job["id"]
+        self.url = job["url"]
+        self.format = job["format"]
+        self.key = job["key"]
+        self.progress = 0.0
+        self.reported = 0.0
+
+    def update(self, **fields):
+        job_store.update(self.id, **fields)
+
+    def progress_hook(self, d):
+        if d['status'] == 'downloading':
+            downloaded = d.get('downloaded_bytes') or 0
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if total:
+                self.progress = round(100 * downloaded / total, 1)
+            # yt-dlp calls this for every chunk; the store only needs a few updates per second.
+            if time.time() - self.reported >= 0.5:
+                self.reported = time.time()
+                self.update(status="downloading", downloaded_bytes=downloaded, total_bytes=total,
+                            speed=d.get('speed'), eta=d.get('eta'), progress=self.progress)
+        elif d['status'] == 'finished':
+            self.update(progress=100.0)
+
+    def postprocessor_hook(self, d):
+        if d['status'] == 'started':
+            self.update(status="processing")
+
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+download_queue = queue.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+# Jobs queued or running in this process; their heartbeat keeps them from being taken for abandoned.
+active_jobs = set()
+active_lock = threading.Lock()
+
+def delete_file(file_path):
+    try:
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+            print(f"File deleted: {file_path}")
+    except Exception as e:
+        print(f"Error deleting {file_path}: {e}")
+
+def evict_cache():
+    for file_path in job_store.evict():
+        delete_file(file_path)
+
 def delete_downloads_folder():
     while True:
-        time.sleep(300) 
+        time.sleep(60) 
+        with active_lock:
+            job_store.heartbeat(active_jobs)
+        job_store.prune()
+        rate_limiter.prune()
+        evict_cache()
+        kept = {os.path.normpath(file_path) for file_path in job_store.cached_files()}
+        # Files the cache does not know about, e.g. from an earlier run or an aborted download.
         for file in os.listdir(DOWNLOAD_FOLDER):
             file_path = os.path.join(DOWNLOAD_FOLDER, file)
             try:
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-                    print(f"File deleted: {file_path}")
-            except Exception as e:
-                print(f"Error deleting {file_path}: {e}")
+                stale = os.path.getmtime(file_path) < time.time() - CACHE_TTL
+            except OSError:
+                continue
+            if stale and os.path.normpath(file_path) not in kept:
+                delete_file(file_path)
 
 threading.Thread(target=delete_downloads_folder, daemon=True).start()                 
 
-def check_rate_limit():
-    current_time = time.time()
+def client_id(request):
+    api_key = request.headers.get("x-api-key")
+    if api_key in API_KEYS:
+        return f"key:{api_key}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
 
-    while request_times and request_times[0] < current_time - TIME_FRAME:
-        request_times.popleft()
-
-    if len(request_times) >= RATE_LIMIT:
-        raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again later.")
-
-    request_times.append(current_time)
+async def check_rate_limit(request):
+    # The SQLite transaction may wait for other workers' locks, so keep it off the event loop.
+    retry_after = await run_in_threadpool(rate_limiter.acquire, client_id(request))
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again later.",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
 
 def sanitize_filename(file_path):
     sanitized_filename = ''.join(c for c in file_path if c.isalnum() or c in ['_', '-'])
@@ -70,74 +380,273 @@ def is_valid_spotify_url(url):
     spotify_regex = r'(https?://)?(open\.spotify\.com|spotify:)/.+'
     return re.match(spotify_regex, url) is not None
 
-@app.post("/download/")
-async def download_video(request: VideoRequest):
+def video_key(url, format):
+    """Identify a download by video ID and output format, so different URLs of one video share a cache entry."""
+    if is_valid_youtube_url(url):
+        match = re.search(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})', url)
+        if match:
+            return f"youtube:{match.group(1)}:{'mp3' if format == 'mp3' else 'video'}"
+    elif is_valid_spotify_url(url):
+        match = re.search(r'track[/:]([A-Za-z0-9]+)', url)
+        if match:
+            return f"spotify:{match.group(1)}:mp3"
+    return f"{url.strip()}:{format}"
+
+def download_youtube(url, format, job):
+    if format == "mp3":
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': '192',
+            }],
+            "outtmpl": os.path.join(DOWNLOAD_FOLDER, "%(title)s [%(id)s].%(ext)s").replace(",", ""),
+            'socket_timeout': 30,
+        }
+    else:
+        ydl_opts = {
+            'format': 'best',
+            "outtmpl": os.path.join(DOWNLOAD_FOLDER, "%(title)s [%(id)s].%(ext)s").replace(",", ""),
+            'socket_timeout': 30,
+        }
+    ydl_opts['progress_hooks'] = [job.progress_hook]
+    ydl_opts['postprocessor_hooks'] = [job.postprocessor_hook]
+    ydl_opts['quiet'] = True
+
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            result = ydl.extract_info(url, download=True)
+    except yt_dlp.utils.DownloadError as e:
+        raise DownloadFailed(f"Download-Error: {str(e)}")
+
+    # yt-dlp sanitizes titles into file names and FFmpegExtractAudio renames the
+    # file to .mp3, so take the final path from yt-dlp instead of rebuilding it.
+    downloads = result.get('requested_downloads') or [{}]
+    return downloads[0].get('filepath')
+
+def download_spotify(url):
+    try:
+        result = subprocess.run(
+            ["spotdl", "download", url, "--output", DOWNLOAD_FOLDER],
+            capture_output=True,
+            text=True,
+            timeout=30
+        )
+    except subprocess.TimeoutExpired:
+        raise DownloadFailed("Download-Timeout: Timeout of 30sec exceeded.")
+    print(f"spotdl stdout: {result.stdout}")
+    print(f"spotdl stderr: {result.stderr}")
+    if result.returncode != 0:
+        raise DownloadFailed(f"Download-Error: {result.stderr}")
+
+    match = re.search(r'Downloaded "([^"]+)"', result.stdout)
+    if not match:
+        match = re.search(r'Skipping (.+?) \(file already exists\)', result.stdout)
+        if not match:
+            raise DownloadFailed("Error while extracting filename.")
+    return os.path.join(DOWNLOAD_FOLDER, match.group(1) + ".mp3")
+
+def run_job(job):
+    job.update(status="downloading")
+    try:
+        if is_valid_youtube_url(job.url):
+            file_path = download_youtube(job.url, job.format, job)
+        else:
+            file_path = download_spotify(job.url)
+    except DownloadFailed as e:
+        job.update(status="error", error=str(e))
+        return
+    except Exception as e:
+        print(f"Exception during download of {job.url}: {str(e)}")
+        job.update(status="error", error=f"Unknown Error: {str(e)}")
+        return
+    if not file_path or not os.path.isfile(file_path):
+        print(f"Downloaded file of {job.url} not found: {file_path}")
+        job.update(status="error", error="Download-Error: Downloaded file not found.")
+        return
+    job_store.finish(job.id, job.key, file_path)
+    evict_cache()
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Job {job.id} finished: {file_path}")
+
+def download_worker():
+    while True:
+        job = download_queue.get()
+        try:
+            run_job(job)
+        except Exception as e:
+            # Store errors escape run_job; fail the job so that nobody waits on it and keep the worker alive.
+            print(f"Exception in download worker for job {job.id}: {str(e)}")
+            try:
+                job_store.fail(job.id, f"Unknown Error: {str(e)}")
+            except Exception as e:
+                print(f"Could not mark job {job.id} as failed: {str(e)}")
+        finally:
+            with active_lock:
+                active_jobs.discard(job.id)
+            download_queue.task_done()
+
+for _ in range(DOWNLOAD_WORKERS):
+    threading.Thread(target=download_worker, daemon=True).start()
+
+@app.post("/download/", status_code=202)
+async def download_video(request: VideoRequest, http_request: Request, response: Response):
     print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Download-request received: URL={request.url}, Format={request.format}")
 
     if not is_valid_youtube_url(request.url) and not is_valid_spotify_url(request.url):
         raise HTTPException(status_code=400, detail="Invalid URL. Only YouTube and Spotify URL's supported.")
-    check_rate_limit()
-
-    if is_valid_youtube_url(request.url):
-        if request.format == "mp3":
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                "outtmpl": os.path.join(DOWNLOAD_FOLDER, "%(title)s.%(ext)s").replace(",", ""),
-                'socket_timeout': 30,
-            }
-        else:
-            ydl_opts = {
-                'format': 'best',
-                "outtmpl": os.path.join(DOWNLOAD_FOLDER, "%(title)s.%(ext)s").replace(",", ""),
-                'socket_timeout': 30,
-            }
+    await check_rate_limit(http_request)
+
+    if not is_valid_youtube_url(request.url):
+        request.format = "mp3"
 
+    key = video_key(request.url, request.format)
+    # Requests for a video that is already being downloaded, by any worker, share that job.
+    job, enqueue = await run_in_threadpool(job_store.submit, request.url, request.format, key)
+
+    if enqueue:
+        with active_lock:
+            active_jobs.add(job["id"])
+        try:
+            download_queue.put_nowait(Job(job))
+        except queue.Full:
+            with active_lock:
+                active_jobs.discard(job["id"])
+            # Concurrent requests for this video may already have been handed the job id.
+            detail = "Too many downloads in progress. Please try again later."
+            await run_in_threadpool(job_store.fail, job["id"], detail)
+            raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "30"})
+
+    result = job_response(job)
+    if result["status"] == "finished":
+        response.status_code = 200
+    result["status_url"] = f"/jobs/{job['id']}"
+    return result
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+    return job_response(job)
+
+def extract_audio_source(url):
+    """Resolve a YouTube URL to the direct URL and request headers of its best audio stream."""
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'socket_timeout': 30,
+        'quiet': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    return info['url'], info.get('http_headers', {}), info.get('title', 'audio')
+
+def start_transcoder(source_url, headers):
+    """Start ffmpeg encoding MP3 to its stdout while a thread pipes the source bytes into its stdin."""
+    source = urllib.request.urlopen(urllib.request.Request(source_url, headers=headers), timeout=30)
+    try:
+        process = subprocess.Popen(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+             "-vn", "-codec:a", "libmp3lame", "-b:a", "192k", "-f", "mp3", "pipe:1"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except Exception:
+        source.close()
+        raise
+
+    def feed():
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                result = ydl.extract_info(request.url, download=True)
+            while chunk := source.read(STREAM_CHUNK_SIZE):
+                process.stdin.write(chunk)
+        except (BrokenPipeError, OSError) as e:
+            print(f"Stopped feeding ffmpeg: {e}")
+        finally:
+            source.close()
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    threading.Thread(target=feed, daemon=True).start()
+    return process
+
+@app.get("/stream/")
+async def stream_audio(url: str, http_request: Request):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Stream-request received: URL={url}")
+
+    if not is_valid_youtube_url(url):
+        raise HTTPException(status_code=400, detail="Invalid URL. Only YouTube URL's can be streamed.")
+    await check_rate_limit(http_request)
+    if not stream_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Too many streams in progress. Please try again later.",
+                            headers={"Retry-After": "30"})
+
+    process = None
+    try:
+        try:
+            source_url, headers, title = await run_in_threadpool(extract_audio_source, url)
         except yt_dlp.utils.DownloadError as e:
             raise HTTPException(status_code=500, detail=f"Download-Error: {str(e)}")
+        try:
+            process = await run_in_threadpool(start_transcoder, source_url, headers)
+        except FileNotFoundError:
+            raise HTTPException(status_code=500, detail="ffmpeg is not installed on the server.")
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Unknown Error: {str(e)}")
 
-        file_extension = "mp3" if request.format == "mp3" else result['ext']
-        file_path = os.path.join(DOWNLOAD_FOLDER, f"{result['title']}.{file_extension}")
-    
-    elif is_valid_spotify_url(request.url):
-        if request.format != "mp3":
-            request.format = "mp3"
+        # Wait for the first encoded bytes, so a source ffmpeg cannot decode still gets a proper error.
+        first_chunk = await run_in_threadpool(process.stdout.read1, STREAM_CHUNK_SIZE)
+        if not first_chunk:
+            error = (await run_in_threadpool(process.stderr.read)).decode(errors="replace").strip()
+            raise HTTPException(status_code=500, detail=f"Transcoding-Error: {error}")
+    except BaseException:
+        if process is not None:
+            process.kill()
+            process.wait()
+        stream_slots.release()
+        raise
 
+    async def mp3_chunks():
         try:
-            result = subprocess.run(
-                ["spotdl", "download", request.url, "--output", DOWNLOAD_FOLDER],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            print(f"spotdl stdout: {result.stdout}")
-            print(f"spotdl stderr: {result.stderr}")
-            if result.returncode != 0:
-                raise HTTPException(status_code=500, detail=f"Download-Error: {result.stderr}")
-            
-            match = re.search(r'Downloaded "([^"]+)"', result.stdout)
-            if not match:
-                match = re.search(r'Skipping ([^ ]+) \(file already exists\)', result.stdout)
-                if not match:
-                    raise HTTPException(status_code=500, detail="Error while extracting filename.")
-            file_name = match.group(1).replace(" ", "%20") + ".mp3"
-            file_path = os.path.join(DOWNLOAD_FOLDER, file_name)
-        except subprocess.TimeoutExpired:
-            raise HTTPException(status_code=500, detail="Download-Timeout: Timeout of 30sec exceeded.")
-        except Exception as e:
-            print(f"Exception during spotdl execution: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Unknown Error: {str(e)}")
+            chunk = first_chunk
+            while chunk:
+                yield chunk
+                chunk = await run_in_threadpool(process.stdout.read1, STREAM_CHUNK_SIZE)
+        finally:
+            # Runs on client disconnect too, where awaiting would be cancelled straight away.
+            process.kill()
+            process.wait()
+            stream_slots.release()
+
+    file_name = f"{sanitize_filename(title) or 'audio'}.mp3"
+    return StreamingResponse(mp3_chunks(), media_type="audio/mpeg",
+                             headers={"Content-Disposition": f'attachment; filename="{file_name}"'})
+
+@app.api_route("/jobs/{job_id}/file", methods=["GET", "HEAD"])
+async def download_file(job_id: str, request: Request):
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+    if job["status"] != "finished":
+        raise HTTPException(status_code=409, detail=f"Download is {job['status']}.")
+    await run_in_threadpool(job_store.touch, job["key"])
+    file_path = job["file_path"]
+    try:
+        stat_result = os.stat(file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail="File has expired. Please request it again.")
 
-    return {"message": f"{request.format.upper()} downloaded: {request.url}", "file_path": file_path}
+    # FileResponse answers Range/If-Range requests and sends the file with
+    # http.response.pathsend (zero-copy) when the ASGI server supports it.
+    response = FileResponse(file_path, filename=os.path.basename(file_path), stat_result=stat_result)
+    etag = response.headers["etag"]
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or
+                          etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers={"etag": etag, "last-modified": response.headers["last-modified"]})
+    return response
 
 if __name__ == "__main__":
     import uvicorn